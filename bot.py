@@ -4,13 +4,23 @@ import discord
 from discord import app_commands
 from discord.ext import tasks, commands
 
+import asyncio
 import logging
+import time
 import xml.etree.ElementTree as et
-from aiohttp import ClientSession
+from urllib.parse import parse_qsl
 import asyncpg
 from typing import TYPE_CHECKING, Optional
 
 import constants
+from utils import metrics, tracing
+from utils.accounts import AccountPool, STKAccount
+from utils.cache import Fingerprint, ResponseCache
+from utils.looplag import LoopLagMonitor
+from utils.offload import Offloader
+from utils.scheduler import Priority, RequestScheduler, SchedulerOverloaded
+from utils.snapshot import Snapshot, parse_chunks
+from utils.transport import STKTransport
 
 log = logging.getLogger("lina.main")
 
@@ -31,6 +41,21 @@ class STKRequestError(Exception):
     pass
 
 
+STK_SESSION_INVALID = "Session not valid"
+
+# Seconds to wait before logging in again after a failed login.
+STK_LOGIN_RETRY_DELAY = 30.0
+
+# Seconds that answers of read-only STK endpoints are reused for.
+STK_CACHE_TTLS = {
+    "/api/v2/user/top-players": 300.0,
+    "/api/v2/user/get-ranking": 120.0,
+    "/api/v2/user/get-friends-list": 120.0,
+    "/api/v2/user/user-search": 60.0,
+    **getattr(constants, "STK_CACHE_TTLS", {})
+}
+
+
 class Lina(commands.Bot):
     """
     Class representing lina herself.
@@ -52,80 +77,229 @@ class Lina(commands.Bot):
                          command_prefix=constants.PREFIX)
 
         self.accent_color = constants.ACCENT_COLOR
-        self.stk_userid: int = None
-        self.stk_token: str = None
-
-    async def stkPostReq(self, target, args):
-        """Helper function to send a POST request to STK servers."""
-        assert self.session is not None
-        log.info(
-            "Sending %s to %s",
-        args.replace(str(self.stk_token), "[REDACTED]").replace(constants.STK_PASSWORD, "[REDACTED]"),
-            str(self.session._base_url) + target
+        accountRate = getattr(constants, "STK_ACCOUNT_RATE", 2.0)
+        accountBurst = getattr(constants, "STK_ACCOUNT_BURST", 4)
+        self.stkAccounts = AccountPool(
+            STKAccount(username, password, rate=accountRate, burst=accountBurst)
+            for username, password in getattr(
+                constants, "STK_ACCOUNTS", [(constants.STK_USERNAME, constants.STK_PASSWORD)])
+        )
+        self.metricsRunner = None
+        # Stage ("xml", "parse", "diff") -> "inline", "thread" or "process"
+        self.offload = Offloader(getattr(constants, "OFFLOAD", {}))
+        self.loopMonitor = LoopLagMonitor(threshold=getattr(constants, "LOOP_LAG_THRESHOLD", 0.5))
+        self.stk: Optional[STKTransport] = None
+        self.scheduler = RequestScheduler(
+            concurrency=getattr(constants, "STK_MAX_CONCURRENCY", 4),
+            rate=getattr(constants, "STK_REQUEST_RATE", 4.0),
+            burst=getattr(constants, "STK_REQUEST_BURST", 8),
+            # Commands that talk to STK defer their response, so they can wait
+            # a while, but not forever
+            wait_limits={Priority.INTERACTIVE: getattr(constants, "STK_INTERACTIVE_WAIT", 10.0)}
+        )
+        self.stkCache = ResponseCache(
+            negative=(STKRequestError,),
+            negative_ttl=getattr(constants, "STK_CACHE_NEGATIVE_TTL", 10.0),
+            name="stk"
         )
-        async with self.session.post(
-            target, data=args,
-            headers={
-                **self.session.headers,
-                "Content-Type": "application/x-www-form-urlencoded"
-            }
-        ) as r:
-            r.raise_for_status()
-
-            data = et.fromstring(await r.text())
 
+    async def stkPostReq(
+        self, target, args="", *,
+        priority: Priority = Priority.INTERACTIVE,
+        auth: bool = True,
+        account: Optional[STKAccount] = None
+    ):
+        """
+        Helper function to send a POST request to STK servers.
+
+        Unless ``auth`` is False, the request is sent with the session of
+        one of the accounts (the least busy one, unless ``account`` is
+        given). A request rejected because the session expired takes that
+        account out of rotation, logs it in again and is sent once more
+        with the new session. If that login fails, another account takes
+        the request, and is logged in again the same way if needed.
+        """
+        assert self.stk is not None
+
+        if not auth:
+            data = await self.offload.run(
+                "xml", et.fromstring, await self.stk.post(target, args, priority=priority))
             if data.attrib["success"] == "no":
                 raise STKRequestError(data.attrib["info"])
-            else:
+            return data
+
+        # Accounts logged in again for this request
+        relogged: set[STKAccount] = set()
+        candidate = account
+        while True:
+            async with self.stkAccounts.lease(candidate) as leased:
+                generation = leased.generation
+                body = "&".join(filter(None, (leased.credentials, args)))
+                response = await self.stk.post(target, body, priority=priority)
+            data = await self.offload.run("xml", et.fromstring, response)
+
+            if data.attrib["success"] != "no":
                 return data
 
-    async def stkGetReq(self, target):
-        """Helper function to send a GET request to STK servers."""
-        assert self.session is not None
-        async with self.session.get(target) as r:
-            r.raise_for_status()
-            return et.fromstring(await r.text())
+            info = data.attrib["info"]
+            if not info.startswith(STK_SESSION_INVALID) or leased in relogged:
+                raise STKRequestError(info)
+
+            log.warning("%s: Session of STK account %s is no longer valid, logging in again.",
+                        target, leased.username)
+            if leased.generation == generation:
+                leased.healthy = False
+            relogged.add(leased)
+            try:
+                await self.reauthSTK(leased, generation)
+            except Exception:
+                # Another account can still take the replay
+                if account is not None or not self.stkAccounts.healthy():
+                    raise
+                candidate = None
+            else:
+                candidate = leased
+
+    async def stkCachedReq(self, target, args=""):
+        """
+        Like stkPostReq, but for read-only endpoints: answers are reused
+        for the endpoint's TTL, errors for a short while, and identical
+        requests made at the same time share one upstream call.
+        """
+        ttl = STK_CACHE_TTLS.get(target)
+        if ttl is None:
+            return await self.stkPostReq(target, args)
+
+        key = (target, tuple(sorted(parse_qsl(args, keep_blank_values=True))))
+        return await self.stkCache.get(key, lambda: self.stkPostReq(target, args), ttl)
+
+    async def stkGetServerList(
+        self, last: Optional[Fingerprint] = None
+    ) -> tuple[Optional[Snapshot], Optional[Fingerprint]]:
+        """
+        Fetches the public server list.
+
+        Returns the new snapshot and its fingerprint, or None instead of
+        the snapshot if the list did not change since ``last``, in which
+        case the body is not parsed at all. The whole body is read first,
+        since whether it changed is only known once all of it is hashed,
+        but it is parsed incrementally, so the full XML tree is never built.
+        """
+        assert self.stk is not None
+        chunks, fingerprint = await self.stk.get_conditional(
+            "/api/v2/server/get-all", last, priority=Priority.CRITICAL)
+        if chunks is None:
+            return None, fingerprint
+
+        with metrics.serverlist_parse_seconds.time(), tracing.span("parse"):
+            snapshot, attrib = await self.offload.run("parse", parse_chunks, chunks)
+
+        if attrib.get("success") == "no":
+            raise STKRequestError(attrib.get("info", ""))
+
+        return snapshot, fingerprint
+
+    async def loginSTK(self, account: STKAccount):
+        """Logs in an STK account, replacing its current session."""
+        log.info(f"Trying to authenticate STK account {account.username}")
+        account.login_attempt = time.monotonic()
+        loginPayload = await self.stkPostReq(
+            "/api/v2/user/connect",
+            f"username={account.username}&"
+            f"password={account.password}&"
+            "save-session=true",
+            priority=Priority.CRITICAL,
+            auth=False
+        )
+
+        account.userid = loginPayload.attrib["userid"]
+        account.token = loginPayload.attrib["token"]
+        account.generation += 1
+        account.started = time.monotonic()
+        account.healthy = True
+
+        log.info(f"STK user {loginPayload.attrib['username']} logged in successfully.")
 
     async def authSTK(self):
         """Authenticate to STK"""
-        log.info(f"Trying to authenticate STK account {constants.STK_USERNAME}")
-        try:
-            loginPayload = await self.stkPostReq(
-                "/api/v2/user/connect",
-                f"username={constants.STK_USERNAME}&"
-                f"password={constants.STK_PASSWORD}&"
-                "save-session=true"
-            )
-        except Exception:
-            log.exception("Unable to authenticate due to error. The bot will now shut down.")
+        async def login(account: STKAccount):
+            async with account.lock:
+                try:
+                    await self.loginSTK(account)
+                except Exception as e:
+                    log.exception(f"Unable to authenticate STK account {account.username}.")
+                    account.login_error = e
+
+        await asyncio.gather(*(login(account) for account in self.stkAccounts))
+
+        if not self.stkAccounts.healthy():
+            log.critical("Unable to log in to any STK account. The bot will now shut down.")
             return await self.close()
 
-        if loginPayload.attrib["success"] == "no":
-            log.critical(f"Unable to login! {loginPayload.attrib['info']}")
-            log.critical("The bot will now shut down.")
-            return await self.close()
+    async def reauthSTK(self, account: STKAccount, generation: int):
+        """
+        Replaces session ``generation`` of an account with a new one.
 
-        self.stk_userid = loginPayload.attrib["userid"]
-        self.stk_token = loginPayload.attrib["token"]
+        Only one login per account runs at a time. Whoever waited for it
+        finds the session already replaced and returns right away, and a
+        failed login is not tried again for a while, so a burst of expired
+        requests never turns into a burst of logins.
+        """
+        async with account.lock:
+            if account.generation != generation:
+                return
 
-        log.info(f"STK user {loginPayload.attrib['username']} logged in successfully.")
+            if account.login_error is not None \
+                    and time.monotonic() - account.login_attempt < STK_LOGIN_RETRY_DELAY:
+                raise account.login_error
+
+            try:
+                await self.loginSTK(account)
+            except Exception as e:
+                log.exception(f"Unable to log in to STK account {account.username} again.")
+                account.login_error = e
+                account.healthy = False
+                raise
+
+            account.login_error = None
+
+    async def keepAlive(self, account: STKAccount):
+        """Keeps the session of one account alive, logging in again if needed."""
+        if not account.healthy:
+            try:
+                await self.reauthSTK(account, account.generation)
+            except Exception:
+                pass
+            return
+
+        refreshAfter = getattr(constants, "STK_SESSION_REFRESH", 6 * 60 * 60)
+        if refreshAfter and time.monotonic() - account.started > refreshAfter:
+            oldSession = account.credentials
+            try:
+                await self.reauthSTK(account, account.generation)
+            except Exception:
+                # Keep using the old session, it might still be good
+                account.healthy = True
+                account.started = time.monotonic()
+            else:
+                log.info(f"Refreshed session of STK account {account.username}.")
+                try:
+                    await self.stkPostReq("/api/v2/user/client-quit", oldSession,
+                                          priority=Priority.CRITICAL, auth=False)
+                except Exception as e:
+                    log.debug("Could not end the old STK session: %s", e)
+            return
 
-    @tasks.loop(minutes=1)
-    async def stkPoll(self):
         try:
-            await self.stkPostReq(
-                "/api/v2/user/poll",
-                f"userid={self.stk_userid}&"
-                f"token={self.stk_token}"
-            )
+            await self.stkPostReq("/api/v2/user/poll", priority=Priority.CRITICAL, account=account)
         except STKRequestError as e:
-            if str(e) in "Session not valid. Please sign in.":
-                log.error("Session invalidated. Reauthenticating...")
-                await self.authSTK()
-            else:
-                log.error("Poll request failed: %s", e)
+            log.error("%s: Poll request failed: %s", account.username, e)
         except Exception:
-            log.exception("Poll request failed due to exception:")
+            log.exception("%s: Poll request failed due to exception:", account.username)
+
+    @tasks.loop(minutes=1)
+    async def stkPoll(self):
+        await asyncio.gather(*(self.keepAlive(account) for account in self.stkAccounts))
 
     async def on_command_error(self, ctx: commands.Context, error: commands.CommandError):
         log.exception("%s: Command error occurred", ctx.command.name, exc_info=error)
@@ -143,6 +317,13 @@ class Lina(commands.Bot):
                     color=self.accent_color
                 ))
 
+            if isinstance(original, SchedulerOverloaded):
+                return await ctx.send(embed=discord.Embed(
+                    title="STK is busy right now",
+                    description="Too many requests are waiting. Please try again in a bit.",
+                    color=self.accent_color
+                ))
+
         return await ctx.send(embed=discord.Embed(
             title="Sorry, this shouldn't have happened. Guru Meditation.",
             description=f"```\n{error.original.__class__.__name__}: {str(error.original)}\n```",
@@ -157,17 +338,48 @@ class Lina(commands.Bot):
             original = error.original
 
             if isinstance(original, STKRequestError):
-                return await interaction.response.send_message(embed=discord.Embed(
+                embed = discord.Embed(
                     title="Sorry, an STK related error occurred.",
                     description=str(original),
                     color=self.accent_color
-                ), ephemeral=True)
-
-            return await interaction.response.send_message(embed=discord.Embed(
-                title="Sorry, this shouldn't have happened. Guru Meditation.",
-                description=f"```\n{error.original.__class__.__name__}: {str(error.original)}\n```",
-                color=self.accent_color
-            ), ephemeral=True)
+                )
+            elif isinstance(original, SchedulerOverloaded):
+                embed = discord.Embed(
+                    title="STK is busy right now",
+                    description="Too many requests are waiting. Please try again in a bit.",
+                    color=self.accent_color
+                )
+            else:
+                embed = discord.Embed(
+                    title="Sorry, this shouldn't have happened. Guru Meditation.",
+                    description=f"```\n{error.original.__class__.__name__}: {str(error.original)}\n```",
+                    color=self.accent_color
+                )
+
+            # Commands that talk to STK defer first, then only a followup can answer
+            if interaction.response.is_done():
+                return await interaction.followup.send(embed=embed, ephemeral=True)
+            return await interaction.response.send_message(embed=embed, ephemeral=True)
+
+    def setupMetrics(self):
+        """Connects the gauges that are read on every scrape."""
+        metrics.online_players.set_function(
+            lambda: len(self.playertrack.onlinePlayers) if self.playertrack else 0)
+        metrics.cached_stk_users.set_function(
+            lambda: len(self.online.cachedSTKUsers) if self.online else 0)
+        metrics.notification_queue_depth.set_function(
+            lambda: self.playertrack.dispatcher.queue_depth if self.playertrack else 0)
+        metrics.stk_accounts.labels(state="healthy").set_function(
+            lambda: len(self.stkAccounts.healthy()))
+        metrics.stk_accounts.labels(state="unhealthy").set_function(
+            lambda: len(self.stkAccounts) - len(self.stkAccounts.healthy()))
+        metrics.stk_scheduler_requests.labels(state="running").set_function(
+            lambda: self.scheduler.active)
+        metrics.stk_scheduler_requests.labels(state="waiting").set_function(self.scheduler.queued)
+        metrics.db_pool_connections.labels(state="used").set_function(
+            lambda: self.pool.get_size() - self.pool.get_idle_size())
+        metrics.db_pool_connections.labels(state="idle").set_function(self.pool.get_idle_size)
+        metrics.db_pool_connections.labels(state="max").set_function(self.pool.get_max_size)
 
     async def setup_hook(self):
         self.tree.error(self.on_app_command_error)
@@ -175,13 +387,23 @@ class Lina(commands.Bot):
         if not hasattr(self, "uptime"):
             self.uptime = discord.utils.utcnow()
 
-        self.session = ClientSession(
-            "https://online.supertuxkart.net",
-            headers={
-                "User-Agent": "DiscordBot (linaSTK 1.0)"
-            }
+        self.loopMonitor.start()
+
+        self.stk = STKTransport(
+            getattr(constants, "STK_API_URL", "https://online.supertuxkart.net"),
+            self.scheduler
         )
 
+        if getattr(constants, "METRICS_PORT", None):
+            self.setupMetrics()
+            try:
+                self.metricsRunner = await metrics.start_server(
+                    getattr(constants, "METRICS_HOST", "127.0.0.1"),
+                    constants.METRICS_PORT
+                )
+            except Exception:
+                log.exception("Unable to start metrics server.")
+
         await self.authSTK()
 
         for extension in extensions:
@@ -194,13 +416,35 @@ class Lina(commands.Bot):
         """Shut down lina"""
 
         log.info("lina is shutting down...")
-        if hasattr(self, 'session'):
+        if self.playertrack is not None:
             try:
-                await self.stkPostReq("/api/v2/user/client-quit",
-                                      f"userid={self.stk_userid}&"
-                                      f"token={self.stk_token}")
+                await self.playertrack.seenBuffer.stop()
+            except Exception:
+                log.exception("Could not flush STK Seen data.")
+
+        if self.online is not None:
+            try:
+                await self.online.userWriter.stop()
+            except Exception:
+                log.exception("Could not flush player cache.")
+
+        if self.stk is not None and not self.stk.closed:
+            try:
+                # Not through the session handling, an expired session
+                # is no reason to log in again
+                await asyncio.gather(*(
+                    self.stkPostReq("/api/v2/user/client-quit", account.credentials,
+                                    priority=Priority.CRITICAL, auth=False)
+                    for account in self.stkAccounts if account.logged_in
+                ), return_exceptions=True)
             finally:
-                await self.session.close()
+                await self.stk.close()
+
+        if self.metricsRunner is not None:
+            await self.metricsRunner.cleanup()
+
+        await self.loopMonitor.stop()
+        self.offload.shutdown()
 
         await super().close()
 
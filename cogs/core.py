@@ -1,10 +1,14 @@
 from __future__ import annotations
 
+import asyncio
 import discord
 from discord.ext import commands
+import io
 import logging
 from typing import TYPE_CHECKING, Optional
 
+from utils.tracing import TickProfiler
+
 log = logging.getLogger("lina.cogs.core")
 
 if TYPE_CHECKING:
@@ -78,6 +82,30 @@ class Core(commands.Cog):
         commands = await self.bot.tree.sync()
         await ctx.reply(f"Successfully synced {len(commands)} commands.")
 
+    @commands.command(hidden=True)
+    async def profileticks(self, ctx: commands.Context, ticks: int = 5):
+        """Profiles the next few server list polls and sends the stats."""
+        playertrack = self.bot.playertrack
+        if playertrack is None:
+            return await ctx.reply("PlayerTrack is not loaded.")
+
+        if playertrack.profiler is not None:
+            return await ctx.reply("Already profiling, please wait until it's done.")
+
+        profiler = TickProfiler(max(1, ticks))
+        playertrack.profiler = profiler
+        await ctx.reply(f"Profiling the next {profiler.remaining} ticks...")
+
+        try:
+            # Ticks run every 5 seconds, leave room for slow and skipped ones
+            report = await asyncio.wait_for(profiler.done, profiler.remaining * 10 + 30)
+        except asyncio.TimeoutError:
+            if playertrack.profiler is profiler:
+                playertrack.profiler = None
+            return await ctx.reply("Profiling timed out, is the server list still being polled?")
+
+        await ctx.reply(file=discord.File(io.BytesIO(report.encode()), filename="ticks.txt"))
+
     @commands.command(hidden=True)
     async def shutdown(self, ctx: commands.Context):
         await ctx.reply("Shutting down :wave:")
@@ -35,7 +35,12 @@ class Misc(commands.Cog):
                 "**Bot started:** {ts}\n"
                 "**Players in STK Seen database**: {stkseen_count}\n"
                 "**Players in Cache**: {playerCache}\n"
-                "**Online Players**: {onlinecount}"
+                "**Player ID cache**: {idCache} entries, {hitRate:.0%} hit rate\n"
+                "**STK response cache**: {stkCache} entries, {stkHits} hits, {stkCoalesced} shared, {stkMisses} misses\n"
+                "**STK accounts**: {stkHealthy}/{stkAccounts} logged in\n"
+                "**Online Players**: {onlinecount}\n"
+                "**Pending notifications**: {notifyqueue}\n"
+                "**Event loop lag**: p50 {lagP50:.1f}ms, p99 {lagP99:.1f}ms, {stalls} stalls"
             ).format(
                 ts=discord.utils.format_dt(self.bot.uptime),
                 stkseen_count=(
@@ -44,7 +49,19 @@ class Misc(commands.Cog):
                 playerCache=(
                     await self.bot.pool.fetchrow("SELECT COUNT(*) FROM lina_discord_stkusers")
                 )["count"],
-                onlinecount=len(self.bot.playertrack.onlinePlayers)
+                idCache=len(self.bot.online.cachedSTKUsers),
+                hitRate=self.bot.online.cachedSTKUsers.hit_rate,
+                stkCache=len(self.bot.stkCache),
+                stkHits=self.bot.stkCache.hits,
+                stkCoalesced=self.bot.stkCache.coalesced,
+                stkMisses=self.bot.stkCache.misses,
+                stkHealthy=len(self.bot.stkAccounts.healthy()),
+                stkAccounts=len(self.bot.stkAccounts),
+                onlinecount=len(self.bot.playertrack.onlinePlayers),
+                notifyqueue=self.bot.playertrack.dispatcher.queue_depth,
+                lagP50=self.bot.loopMonitor.percentile(50) * 1000,
+                lagP99=self.bot.loopMonitor.percentile(99) * 1000,
+                stalls=self.bot.loopMonitor.stalls
             ),
             color=self.bot.accent_color
         ), mention_author=False)
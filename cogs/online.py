@@ -6,9 +6,17 @@ from discord.ext import commands, tasks
 
 import constants
 import logging
-from typing import TYPE_CHECKING, Any
-from utils.formatting import bigip, flagconverter
+from typing import TYPE_CHECKING, Any, Optional
+from utils.addonindex import STATUS_FLAGS, AddonIndex
+from utils.addons import Addon, iter_addons
+from utils.cache import Fingerprint, LRUCache
+from utils.formatting import bigip, flagconverter, humanize_size
 from utils.paginator import ButtonPaginator
+from utils.prefixindex import PrefixIndex, prefix_clause
+from utils.scheduler import Priority
+from utils.snapshot import Snapshot
+from utils.tracks import BUILTIN_TRACKS, build_track_names, resolve_track
+from utils.writebehind import WriteBehindBuffer
 
 if TYPE_CHECKING:
     from bot import Lina
@@ -38,214 +46,272 @@ class Online(commands.Cog):
 
     def __init__(self, bot: Lina):
         self.bot: Lina = bot
-        self.addons_dict = {}
-        self.cachedSTKUsers = {}
-
-    async def addUsersToCache(self, users: list):
-
-        if len(users) == 1:
-            return await self.addUserToCache(users[0][0], users[0][1])
-
-        async with self.bot.pool.acquire() as conn:
-
-            pre = await conn.prepare("INSERT INTO lina_discord_stkusers (id, username) VALUES ($1, $2) ON CONFLICT DO NOTHING")
-
-            for user in users:
-                if user[0] not in self.cachedSTKUsers:
-                    log.debug("Adding %s (%d) to cache...",
-                              user[1], user[0])
-                    self.cachedSTKUsers[user[0]] = user[1]
-
-            await pre.executemany(users)
-
-    def idToUsername(self, userid: int):
+        # addon ID -> Addon, as currently stored in the database
+        self.addons_dict: dict[str, Addon] = {}
+        self.addonsFingerprint: Optional[Fingerprint] = None
+        self.addonIndex = AddonIndex()
+        # track ID -> name, replaced as a whole whenever the catalogue changes
+        self.trackNames: dict[str, str] = dict(BUILTIN_TRACKS)
+        cacheSize = getattr(constants, "STK_USER_CACHE_SIZE", 10000)
+        # STK user ID -> username
+        self.cachedSTKUsers: LRUCache[int, str] = LRUCache(cacheSize)
+        # lowercased username -> STK user ID
+        self.cachedSTKIds: LRUCache[str, int] = LRUCache(cacheSize)
+        # Most recently seen or looked up usernames, for autocomplete
+        self.usernameIndex = PrefixIndex(maxsize=cacheSize)
+        self.userWriter = WriteBehindBuffer(self.writeUsers, interval=10.0, name="stkusers")
+        # (snapshot version, track names, pages) of the last rendered /online
+        self.onlinePages: Optional[tuple[int, dict[str, str], list[discord.Embed]]] = None
+
+    def cacheUser(self, userid: int, username: str):
+        """Remembers a user in memory only."""
+        self.cachedSTKUsers.put(userid, username)
+        self.cachedSTKIds.put(username.lower(), userid)
+        self.usernameIndex.add(username)
+
+    def addUsersToCache(self, users: list):
+        for userid, username in users:
+            self.addUserToCache(userid, username)
+
+    async def idToUsername(self, userid: int):
         """
-        Converts a given ID to a usernaFalse
-        Returns the ID if it's not found in the cache.
+        Converts a given ID to a username.
+        Returns the ID if it's not found in the cache or the database.
         """
 
-        try:
-            return self.cachedSTKUsers[userid]
-        except IndexError:
+        username = self.cachedSTKUsers.get(userid)
+        if username is not None:
+            return username
+
+        username = await self.bot.pool.fetchval(
+                "SELECT username FROM lina_discord_stkusers WHERE id = $1",
+                userid)
+
+        if username is None:
             return userid
 
+        self.cacheUser(userid, username)
+        return username
+
     async def usernameToId(self, username: str):
         """
         Converts a username to an ID.
 
+        Exact matches are answered from the cache, anything else is
+        looked up by prefix in the database.
         Raises IndexError if player isn't found in the database.
         """
 
-        sql_esc = str.maketrans({
-            "%": "\\%",
-            "_": "\\_",
-            "\\": "\\\\"
-        })
+        userid = self.cachedSTKIds.get(username.lower())
+        if userid is not None:
+            cached = self.cachedSTKUsers.get(userid)
+            if cached is not None and cached.lower() == username.lower():
+                return (userid, cached)
+
+        if not username:
+            raise IndexError("Could not find user with an empty name in database.")
 
+        clause, args = prefix_clause("lower(username)", username.lower())
         data = await self.bot.pool.fetchrow(
-                "SELECT * FROM lina_discord_stkusers "
-                "WHERE username ILIKE $1 "
-                "GROUP BY id FETCH FIRST 1 ROW ONLY",
-                username.translate(sql_esc) + '%')
+                f"SELECT * FROM lina_discord_stkusers {clause} FETCH FIRST 1 ROW ONLY",
+                *args)
         
         if not data:
             raise IndexError(f"Could not find user {username} in database.")
 
+        self.cacheUser(data["id"], data["username"])
         return (data["id"], data["username"])
 
-    async def addUserToCache(self, userid: int, username: str):
-        log.debug("Adding %s (%d) to cache...",
-                  username, userid)
+    def addUserToCache(self, userid: int, username: str):
+        """
+        Remembers a user and queues it to be saved to the database,
+        unless it is already known.
+        """
+        if self.cachedSTKUsers.peek(userid) != username:
+            self.userWriter.add(userid, (userid, username))
+        self.cacheUser(userid, username)
 
-        if userid not in self.cachedSTKUsers:
-            self.cachedSTKUsers[userid] = username
+    async def writeUsers(self, rows: list[tuple[int, str]]):
+        """Bulk inserts queued users into lina_discord_stkusers."""
         await self.bot.pool.execute(
-                "INSERT INTO lina_discord_stkusers (id, username) VALUES ($1, $2) "
+                "INSERT INTO lina_discord_stkusers (id, username) "
+                "SELECT * FROM unnest($1::int[], $2::varchar[]) "
                 "ON CONFLICT DO NOTHING",
-                userid, username)
+                [x[0] for x in rows], [x[1] for x in rows])
+
+    def usernameChoices(self, current: str) -> list[app_commands.Choice[str]]:
+        """Autocomplete choices for a partially typed username."""
+        return [
+            app_commands.Choice(name=name, value=name)
+            for name in self.usernameIndex.search(current, limit=25)
+        ]
+
+    async def usernameAutocomplete(self, interaction: discord.Interaction, current: str):
+        return self.usernameChoices(current)
+
+
+    async def loadAddons(self):
+        """Loads the addon catalogue as stored in the database."""
+        data = await self.bot.pool.fetch(
+            "SELECT id, name, file, date, uploader, designer, description, "
+            "image, format, revision, status, size, rating "
+            "FROM lina_discord_addons WHERE NOT removed")
+        self.addons_dict = {x["id"]: Addon(*x.values()) for x in data}
+        self.addonIndex = AddonIndex(self.addons_dict.values())
+        self.trackNames = build_track_names(self.addons_dict.values())
+        log.info("Loaded %d addons from the database.", len(self.addons_dict))
+
+    @tasks.loop(minutes=15)
+    async def syncAddons(self):
+        try:
+            await self.syncAddonsOnce()
+        except Exception:
+            log.exception("Addon sync failed.")
+            # Make sure the next run fetches and compares everything again.
+            self.addonsFingerprint = None
+
+    async def syncAddonsOnce(self):
+        if self.addonsFingerprint is None:
+            await self.loadAddons()
+
+        chunks, self.addonsFingerprint = await self.bot.stk.get_conditional(
+            "/downloads/xml/online_assets.xml", self.addonsFingerprint,
+            priority=Priority.BULK)
+
+        if chunks is None:
+            log.debug("Addon catalogue unchanged.")
+            return
+
+        addons = {}
+        changed = []
+        for addon in iter_addons(chunks):
+            addons[addon.id] = addon
+            if self.addons_dict.get(addon.id) != addon:
+                changed.append(addon)
+
+        removed = [x for x in self.addons_dict if x not in addons]
+
+        if changed or removed:
+            async with self.bot.pool.acquire() as con:
+                async with con.transaction():
+                    if changed:
+                        pre = await con.prepare(
+                            """
+                            INSERT INTO lina_discord_addons
+                                (id, name, file, date, uploader, designer, description,
+                                image, format, revision, status, size, rating)
+                            VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11, $12, $13)
+                            ON CONFLICT (id) DO UPDATE SET
+                                name = $2,
+                                file = $3,
+                                date = $4,
+                                uploader = $5,
+                                designer = $6,
+                                description = $7,
+                                image = $8,
+                                format = $9,
+                                revision = $10,
+                                status = $11,
+                                size = $12,
+                                rating = $13,
+                                removed = false
+                            ;
+                            """
+                        )
+                        await pre.executemany(changed)
+
+                    if removed:
+                        await con.execute(
+                            "UPDATE lina_discord_addons SET removed = true WHERE id = ANY($1::varchar[])",
+                            removed)
+
+        for addon in changed:
+            self.addonIndex.update(addon)
+        for _id in removed:
+            self.addonIndex.remove(_id)
+
+        self.addons_dict = addons
+        if changed or removed:
+            self.trackNames = build_track_names(addons.values())
+        log.info("Synced addons: %d new or changed, %d removed, %d total.",
+                 len(changed), len(removed), len(addons))
 
-    async def populateCache(self):
-        log.info("Populating player cache...")
+    def convertAddonIdToName(self, _id: str):
+        return resolve_track(self.trackNames, _id)
 
-        data = await self.bot.pool.fetch("SELECT * FROM lina_discord_stkusers")
+    async def cog_load(self):
+        self.userWriter.start()
+        self.syncAddons.start()
 
-        for _ in data:
-            log.debug("Adding %s (%d) to cache...",
-                      _["username"], _["id"])
+    async def cog_unload(self):
+        self.syncAddons.cancel()
+        await self.userWriter.stop()
 
-            self.cachedSTKUsers[_["id"]] = _["username"]
+    def renderOnline(self, serverlist: Snapshot) -> list[discord.Embed]:
+        """
+        Renders the server list into embed pages that stay within
+        Discord's limits of 25 fields and 6000 characters per embed.
+        """
+        fields = []
+        for server in serverlist:
+            players = server.players
 
-        log.info("Finished populating player cache.")
+            log.debug(f"Server {server.name} players: {len(players)}")
 
+            if len(players) == 0:
+                continue
 
-    @tasks.loop(hours=2)
-    async def syncAddons(self):
-        addondata = await self.bot.stkGetReq("/downloads/xml/online_assets.xml")
-
-        addons = []
-        for a in addondata.findall("track"):
-            addons.append((
-                a.attrib["id"],
-                a.attrib["name"],
-                a.attrib["file"],
-                int(a.attrib["date"]),
-                a.attrib["uploader"],
-                a.attrib["designer"],
-                a.attrib["description"],
-                a.get("image", ""),
-                int(a.attrib["format"]),
-                int(a.attrib["revision"]),
-                int(a.attrib["status"]),
-                int(a.attrib["size"]),
-                float(a.attrib["rating"])
-            ))
+            # Some servers (such as Frankfurt servers) have
+            # newlines on their names, and it looks ugly on embed
+            # and can potentially break the layout. So strip them out.
+            serverName = server.name \
+                .replace("\r", "") \
+                .replace("\n", "")
+            serverCountry = flagconverter(server.country_code)
+            currentTrack = self.convertAddonIdToName(server.current_track)
+            ip = bigip(server.ip)
 
-            self.addons_dict[a.attrib["id"]] = {
-                "id": a.attrib["id"],
-                "name":  a.attrib["name"],
-                "file": a.attrib["file"],
-                "date": int(a.attrib["date"]),
-                "uploader": a.attrib["uploader"],
-                "designer": a.attrib["designer"],
-                "description": a.attrib["description"],
-                "image": a.get("image", ""),
-                "format": int(a.attrib["format"]),
-                "revision": int(a.attrib["revision"]),
-                "status": int(a.attrib["status"]),
-                "size": int(a.attrib["size"]),
-                "rating": float(a.attrib["rating"])
-            }
-
-        async with self.bot.pool.acquire() as con:
-            pre = await con.prepare(
-                """
-                INSERT INTO lina_discord_addons
-                    (id, name, file, date, uploader, designer, description,
-                    image, format, revision, status, size, rating)
-                VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11, $12, $13)
-                ON CONFLICT (id) DO UPDATE SET
-                    id = $1,
-                    name = $2,
-                    file = $3,
-                    date = $4,
-                    uploader = $5,
-                    designer = $6,
-                    description = $7,
-                    image = $8,
-                    format = $9,
-                    revision = $10,
-                    status = $11,
-                    size = $12,
-                    rating = $13
-                ;
-                """
+            name = f"{serverCountry} {serverName} ({ip}): {len(players)} player{'s' if len(players) > 1 else ''} - {currentTrack}:"
+            value = "\n".join(
+                [f"{flagconverter(x.country_code)} {x.username}" for x in players]
             )
+            fields.append((name[:256], value[:1024]))
 
-            await pre.executemany(addons)
-
-    def convertAddonIdToName(self, _id: str):
-
-        _id = _id.removeprefix('addon_')
-
-        match _id:
-            case 'abyss': return 'Abyss'
-            case 'alien_signal': return 'Alien Signal'
-            case 'ancient_colosseum_labrynth': return 'Ancient Colosseum Labrynth'
-            case 'arena_candela_city': return 'Candela City'
-            case 'battleisland': return 'Battle Island'
-            case 'black_forest': return 'Black Forest'
-            case 'candela_city': return 'Candela City'
-            case 'cave': return 'Cave X'
-            case 'cocoa_temple': return 'Cocoa Temple'
-            case 'cornfield_crossing': return 'Cornfield Crossing'
-            case 'endcutscene': return 'What the fuck?'
-            case 'featunlock': return 'lina is the best!!'
-            case 'fortmagma': return 'Fort Magma'
-            case 'gplose': return 'You lost? Too bad.'
-            case 'gpwin': return 'Huh?'
-            case 'gran_paradiso_island': return 'Gran Paradiso Island'
-            case 'hacienda': return 'Hacienda'
-            case 'hole_drop': return 'Hole Drop'
-            case 'icy_soccer_field': return 'Icy Soccer Field'
-            case 'introcutscene': return 'Intro Cutscene'
-            case 'introcutscene2': return 'Intro Cutscene (Part 2)'
-            case 'lasdunasarena': return 'Las Dunas Arena'
-            case 'lighthouse': return 'Around the Lighthouse'
-            case 'mines': return 'Old Mine'
-            case 'minigolf': return 'Minigolf'
-            case 'oasis': return 'Oasis'
-            case 'olivermath': return 'Oliver\'s Math Class'
-            case 'overworld': return 'Overworld'
-            case 'pumpkin_park': return 'Pumpkin Park'
-            case 'ravenbridge_mansion': return 'Ravenbridge Mansion'
-            case 'sandtrack': return 'Shifting Sands'
-            case 'scotland': return 'Nessie\'s Pond'
-            case 'snowmountain': return 'Northern Resort'
-            case 'snowtuxpeak': return 'Snow Peak'
-            case 'soccer_field': return 'Soccer Field'
-            case 'stadium': return 'The Stadium'
-            case 'stk_enterprise': return 'STK Enterprise'
-            case 'temple': return 'Temple'
-            case 'tutorial': return 'Tutorial'
-            case 'volcano_island': return 'Volcan Island'
-            case 'xr591': return 'XR591'
-            case 'zengarden': return 'Zen Garden'
-            case _: pass
-
-        try:
-            return self.addons_dict[_id]['name']
-        except KeyError:
-            if _id == '':
-                return 'None'
-            else:
-                return f'Unknown track (ID: `{_id}`)'
-
-    async def cog_load(self):
-        self.bot.loop.create_task(self.populateCache())
-        self.syncAddons.start()
-
-    def cog_unload(self):
-        self.syncAddons.cancel()
+        if not fields:
+            return [discord.Embed(
+                description="Nobody is currently playing.",
+                color=self.bot.accent_color
+            )]
+
+        title = "Public Online"
+        pages: list[discord.Embed] = []
+        embed = None
+        size = 0
+        for name, value in fields:
+            # Leave some room for the footer
+            if embed is None or len(embed.fields) == 25 or size + len(name) + len(value) > 5900:
+                embed = discord.Embed(title=title, color=self.bot.accent_color)
+                pages.append(embed)
+                size = len(title)
+
+            embed.add_field(name=name, value=value, inline=False)
+            size += len(name) + len(value)
+
+        if len(pages) > 1:
+            for i, embed in enumerate(pages):
+                embed.set_footer(text=f"Page {i + 1}/{len(pages)}")
+
+        return pages
+
+    def getOnlinePages(self, serverlist: Snapshot) -> list[discord.Embed]:
+        """Returns the /online pages for a snapshot, rendering them only once."""
+        cached = self.onlinePages
+        if cached is not None and cached[0] == serverlist.version and cached[1] is self.trackNames:
+            return cached[2]
+
+        pages = self.renderOnline(serverlist)
+        self.onlinePages = (serverlist.version, self.trackNames, pages)
+        return pages
 
     @app_commands.command(
         name="online",
@@ -254,56 +320,100 @@ class Online(commands.Cog):
     async def online(self, interaction: discord.Interaction):
         serverlist = self.bot.playertrack.serverlist
 
-        embed = discord.Embed(
-            title = "Public Online",
-            color = self.bot.accent_color
-        )
+        if serverlist is None:
+            return await interaction.response.send_message(embed=discord.Embed(
+                description="The server list has not been fetched yet, try again in a few seconds.",
+                color=self.bot.accent_color
+            ))
 
-        for i in range(len(serverlist[0])):
-            serverInfo = serverlist[0][i][0]
-            # Some servers (such as Frankfurt servers) have
-            # newlines on their names, and it looks ugly on embed
-            # and can potentially break the layout. So strip them out.
-            serverName = serverInfo.attrib["name"] \
-                .replace("\r", "") \
-                .replace("\n", "")
-            serverCountry = flagconverter(serverInfo.attrib["country_code"])
-            currentTrack = self.convertAddonIdToName(serverInfo.attrib["current_track"])
-            currentPlayers = int(serverInfo.attrib["current_players"])
-            password = int(serverInfo.attrib["password"]) == 1
-            ip = bigip(serverInfo.attrib["ip"])
-            port = int(serverInfo.attrib["port"])
+        pages = self.getOnlinePages(serverlist)
+        await ButtonPaginator(pages, author_id=interaction.user.id).start(interaction)
 
-            players = serverlist[0][i][1]
+    @app_commands.command(name="addon", description="Search for an addon track.")
+    @app_commands.describe(
+        query="Name, designer, uploader or words from the description.",
+        status="Only show addons with this status.",
+        format="Only show addons of this file format version.",
+        max_size="Maximum download size in MB."
+    )
+    @app_commands.choices(status=[
+        app_commands.Choice(name="Approved", value="approved"),
+        app_commands.Choice(name="Featured", value="featured"),
+        app_commands.Choice(name="Release candidate", value="rc"),
+        app_commands.Choice(name="Beta", value="beta"),
+        app_commands.Choice(name="Alpha", value="alpha"),
+    ])
+    async def addon(
+        self,
+        interaction: discord.Interaction,
+        query: str,
+        status: Optional[app_commands.Choice[str]] = None,
+        format: Optional[int] = None,
+        max_size: Optional[float] = None
+    ):
+        results = self.addonIndex.search(
+            query,
+            status=STATUS_FLAGS[status.value] if status else None,
+            format=format,
+            max_size=int(max_size * 1024 * 1024) if max_size is not None else None,
+            limit=10
+        )
 
-            log.debug(f"Server {serverName} players: {len(players)}")
+        if not results:
+            return await interaction.response.send_message(embed=discord.Embed(
+                title=f"Search results for \"{query}\"",
+                description="No addons found :(",
+                color=self.bot.accent_color
+            ))
 
-            if len(players) == 0:
-                continue
+        best = results[0]
+        if len(results) == 1 or query.strip().lower() in (best.id, best.name.lower()):
+            flags = [k.upper() if k in ("rc", "hq", "dfsg") else k.capitalize()
+                     for k, v in STATUS_FLAGS.items() if best.status & v]
 
-            embed.add_field(
-                name=f"{serverCountry} {serverName} ({ip}): {len(players)} player{'s' if len(players) > 1 else ''} - {currentTrack}:",
-                value="\n".join(
-                    [f"{flagconverter(x.attrib['country-code'])} {x.attrib['username']}" for x in players]
-                ),
-                inline=False
-            )
-        if len(embed.fields) == 0:
-            await interaction.response.send_message(embed=discord.Embed(
-                description="Nobody is currently playing.",
+            embed = discord.Embed(
+                title=best.name,
+                description=best.description[:4000] or None,
+                url=best.file or None,
                 color=self.bot.accent_color
-            ))
-        else:
-            await interaction.response.send_message(embed=embed)
+            )
+            embed.add_field(name="Designer", value=best.designer or "Unknown")
+            embed.add_field(name="Uploader", value=best.uploader or "Unknown")
+            embed.add_field(name="Rating", value=f"{round(best.rating, ndigits=2)} / 3")
+            embed.add_field(name="Size", value=humanize_size(best.size))
+            embed.add_field(name="Revision", value=str(best.revision))
+            embed.add_field(name="Status", value=", ".join(flags) or "None")
+            embed.set_footer(text=f"ID: {best.id}")
+            if best.image:
+                embed.set_thumbnail(url=best.image)
+
+            return await interaction.response.send_message(embed=embed)
+
+        await interaction.response.send_message(embed=discord.Embed(
+            title=f"Search results for \"{query}\"",
+            description="\n".join([
+                f"* **{x.name}** by {x.designer or 'Unknown'} — "
+                f"{round(x.rating, ndigits=2)} / 3, {humanize_size(x.size)} (`{x.id}`)"
+                for x in results
+            ]),
+            color=self.bot.accent_color
+        ))
+
+    @addon.autocomplete("query")
+    async def addon_autocomplete(self, interaction: discord.Interaction, current: str):
+        return [
+            app_commands.Choice(name=x.name[:100], value=x.id)
+            for x in self.addonIndex.search(current, limit=25)
+        ]
 
     @app_commands.command(name="top-players", description="Get top 10 ranked players.")
     async def topplayers(self, interaction: discord.Interaction):
+        # STK can take longer to answer than Discord waits for a response
+        await interaction.response.defer()
 
-        data = await self.bot.stkPostReq("/api/v2/user/top-players",
-                                         f"userid={self.bot.stk_userid}&" \
-                                         f"token={self.bot.stk_token}")
+        data = await self.bot.stkCachedReq("/api/v2/user/top-players")
 
-        await interaction.response.send_message(embed=discord.Embed(
+        await interaction.followup.send(embed=discord.Embed(
             title="Top 10 ranked players",
             description="\n".join([
                 f"{x + 1}. {data[0][x].attrib['username']} — {round(float(data[0][x].attrib['scores']), ndigits=2)} (Max: {round(float(data[0][x].attrib['max-scores']), ndigits=2)})" for x in range(len(data[0]))
@@ -314,22 +424,22 @@ class Online(commands.Cog):
     @app_commands.command(name="usersearch", description="Search for a user in STK.")
     @app_commands.describe(query="The search query.")
     async def usersearch(self, interaction: discord.Interaction, query: str):
-        data = await self.bot.stkPostReq(
+        await interaction.response.defer()
+
+        data = await self.bot.stkCachedReq(
             "/api/v2/user/user-search",
-            f"userid={self.bot.stk_userid}&"
-            f"token={self.bot.stk_token}&"
             f"search-string={query}"
         )
 
         if len(data[0]) == 0:
-            await interaction.response.send_message(embed=discord.Embed(
+            await interaction.followup.send(embed=discord.Embed(
                 title=f"Search results for \"{query}\"",
                 description="No results :(",
                 color=self.bot.accent_color
             ))
         else:
-            await self.addUsersToCache([ (int(x.attrib['id']), x.attrib['user_name']) for x in data[0] ])
-            await interaction.response.send_message(embed=discord.Embed(
+            self.addUsersToCache([ (int(x.attrib['id']), x.attrib['user_name']) for x in data[0] ])
+            await interaction.followup.send(embed=discord.Embed(
                 title=f"Search results for \"{query}\"",
                 description="\n".join([
                     f"* {x.attrib['user_name']} ({x.attrib['id']})" for x in data[0]
@@ -339,7 +449,9 @@ class Online(commands.Cog):
 
     @app_commands.command(name="friendslist", description="Get a user's friends list.")
     @app_commands.describe(user="The user ID or name of target user.")
+    @app_commands.autocomplete(user=usernameAutocomplete)
     async def friendslist(self, interaction: discord.Interaction, user: str):
+        await interaction.response.defer()
 
         try:
             user = int(user)
@@ -347,27 +459,23 @@ class Online(commands.Cog):
             pass
 
         if isinstance(user, int):
-            username = self.idToUsername(user)
-            data = await self.bot.stkPostReq(
+            username = await self.idToUsername(user)
+            data = await self.bot.stkCachedReq(
                 "/api/v2/user/get-friends-list",
-                f"userid={self.bot.stk_userid}&"
-                f"token={self.bot.stk_token}&"
                 f"visitingid={user}"
             )
         else:
             try:
                 userid, username = await self.usernameToId(user)
             except IndexError:
-                return await interaction.response.send_message(embed=discord.Embed(
+                return await interaction.followup.send(embed=discord.Embed(
                     title="Error",
                     description=f"I couldn't find user {user} in the database. If possible, try specifying their User ID instead.",
                     color=self.bot.accent_color
                 ))
 
-            data = await self.bot.stkPostReq(
+            data = await self.bot.stkCachedReq(
                 "/api/v2/user/get-friends-list",
-                f"userid={self.bot.stk_userid}&"
-                f"token={self.bot.stk_token}&"
                 f"visitingid={userid}"
             )
 
@@ -379,13 +487,13 @@ class Online(commands.Cog):
                 _id=data[0][x][0].attrib["id"])
             )
 
-        await self.addUsersToCache([(
+        self.addUsersToCache([(
             int(data[0][x][0].attrib["id"]),
             data[0][x][0].attrib["user_name"])
             for x in range(len(data[0]))])
 
         if len(res) == 0:
-            return await interaction.response.send_message(embed=discord.Embed(
+            return await interaction.followup.send(embed=discord.Embed(
                 title="Error",
                 description=f"User {username} has no friends :(",
                 color=self.bot.accent_color
@@ -396,7 +504,9 @@ class Online(commands.Cog):
     
     @app_commands.command(name="rank", description="Get a user's ranking")
     @app_commands.describe(user="The user's ID or name")
+    @app_commands.autocomplete(user=usernameAutocomplete)
     async def stk_rank(self, interaction: discord.Interaction, user: str):
+        await interaction.response.defer()
 
         try:
             user = int(user)
@@ -404,38 +514,34 @@ class Online(commands.Cog):
             pass
 
         if isinstance(user, int):
-            username = self.idToUsername(user)
-            data = self.bot.stkPostReq(
+            username = await self.idToUsername(user)
+            data = await self.bot.stkCachedReq(
                     "/api/v2/user/get-ranking",
-                    f"userid={self.bot.stk_userid}&"
-                    f"token={self.bot.stk_token}&"
                     f"id={user}"
             )
         else:
             try:
                 userid, username = await self.usernameToId(user)
             except IndexError:
-                return await interaction.response.send_message(embed=discord.Embed(
+                return await interaction.followup.send(embed=discord.Embed(
                     title="Error",
                     description=f"I couldn't find user {user} in the database. If possible, try specifying their User ID instead.",
                     color=self.bot.accent_color
                 ))
 
-            data = await self.bot.stkPostReq(
+            data = await self.bot.stkCachedReq(
                 "/api/v2/user/get-ranking",
-                f"userid={self.bot.stk_userid}&"
-                f"token={self.bot.stk_token}&"
                 f"id={userid}"
             )
 
 
         if int(data.attrib["rank"]) <= 0:
-            return await interaction.response.send_message(embed=discord.Embed(
+            return await interaction.followup.send(embed=discord.Embed(
                 description=f"{username} has no ranking yet.",
                 color=self.bot.accent_color
             ))
         else:
-            return await interaction.response.send_message(embed=discord.Embed(
+            return await interaction.followup.send(embed=discord.Embed(
                 title=f"{username}'s Ranking Info",
                 description=(
                     f"**Rank**: {data.attrib['rank']}\n"
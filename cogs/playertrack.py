@@ -3,14 +3,23 @@ from __future__ import annotations
 import discord
 from discord.ext import commands, tasks
 from discord import app_commands, ui
+import contextlib
 import logging
 import datetime
 import time
-import xml.etree.ElementTree as et
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Optional
 
 import constants
+from utils import metrics, tracing
+from utils.dispatcher import NotificationDispatcher
+from utils.cache import Fingerprint
 from utils.formatting import bigip, flagconverter, humanize_timedelta
+from utils.poller import PollerMessage, PollerProcess
+from utils.prefixindex import prefix_clause
+from utils.serverdiff import ServerListDiff, diff_server_lists
+from utils.snapshot import Player, Server, Snapshot
+from utils.tracing import TickProfiler
+from utils.writebehind import WriteBehindBuffer
 
 if TYPE_CHECKING:
     from bot import Lina
@@ -45,345 +54,304 @@ class Confirmation(ui.View):
 class PlayerTrack(commands.Cog):
     def __init__(self, bot: Lina):
         self.bot: Lina = bot
-        self.lastserverlist = None
-        self.serverlist = None
-        self.onlinePlayers = {}
-
-    async def ptrackNotifyJoin(self, user: int, userdata: dict, serverdata: dict):
-        user = self.bot.get_user(user)
-        assert user is not None
-
-        await user.send(embed=discord.Embed(
-            title=f"STK Player Tracker",
-            description=(
-                "{country} {username} joined a server.\n" \
-                "Server: {serverCountry} {server}"
-            ).format(
-                country=flagconverter(userdata["country-code"]),
-                username=userdata["username"],
-                serverCountry=flagconverter(serverdata["country_code"]),
-                server=str(serverdata["name"])
+        self.lastserverlist: Snapshot = None
+        self.serverlist: Snapshot = None
+        # username -> server the player is currently in
+        self.onlinePlayers: dict[str, Server] = {}
+        self.fingerprint: Optional[Fingerprint] = None
+        # Number of polls skipped because the server list did not change
+        self.unchangedTicks = 0
+        self.dispatcher = NotificationDispatcher(self.ptrackNotify)
+        self.seenBuffer = WriteBehindBuffer(self.writeSeen, name="stk-seen")
+        # Ticks taking longer than this (in seconds) are logged with their spans
+        self.slowTickBudget: float = getattr(constants, "SLOW_TICK_BUDGET", 2.5)
+        self.profiler: Optional[TickProfiler] = None
+        # Polls in a separate process instead of fetcherWrapper, if enabled
+        self.poller: Optional[PollerProcess] = None
+        # Number of the last snapshot received from the poller process
+        self.pollerSeq = 0
+        # username -> set of Discord user IDs tracking that username
+        self.trackedPlayers: dict[str, set[int]] = {}
+
+    async def buildTrackIndex(self):
+        """Builds the reverse index of tracked usernames from the database."""
+        index = {}
+        for row in await self.bot.pool.fetch("SELECT id, usernames FROM lina_discord_ptrack"):
+            for username in row["usernames"] or ():
+                index.setdefault(username, set()).add(row["id"])
+
+        self.trackedPlayers = index
+        log.info("Built player track index with %d usernames.", len(index))
+
+    def trackIndexAdd(self, userid: int, username: str):
+        self.trackedPlayers.setdefault(username, set()).add(userid)
+
+    def trackIndexRemove(self, userid: int, username: str):
+        subscribers = self.trackedPlayers.get(username)
+        if subscribers is None:
+            return
+
+        subscribers.discard(userid)
+        if not subscribers:
+            del self.trackedPlayers[username]
+
+    def trackIndexClear(self, userid: int):
+        for username in [k for k, v in self.trackedPlayers.items() if userid in v]:
+            self.trackIndexRemove(userid, username)
+
+    async def ptrackNotify(self, user: int, events: list[tuple[str, Player, Server]]):
+        """Sends one DM summarizing every tracked join/leave of a tick."""
+        recipient = self.bot.get_user(user)
+        if recipient is None:
+            log.warning("Could not notify %d: user not found.", user)
+            return
+
+        # Group players by what happened and where, keeping event order.
+        grouped: dict[tuple[str, int], tuple[Server, list[Player]]] = {}
+        for kind, player, server in events:
+            grouped.setdefault((kind, server.id), (server, []))[1].append(player)
+
+        lines = []
+        for (kind, _), (server, players) in grouped.items():
+            lines.append("{players} {action}.\nServer: {serverCountry} {server}".format(
+                players=", ".join(
+                    f"{flagconverter(x.country_code)} {x.username}" for x in players
+                ),
+                action="joined a server" if kind == "joined" else "left",
+                serverCountry=flagconverter(server.country_code),
+                server=server.name
                 .replace("\r", "")
                 .replace("\n", "")
-            ),
-            color=self.bot.accent_color
-        ).set_thumbnail(
-            url="https://raw.githubusercontent.com/supertuxkart/stk-code/master/data/supertuxkart_256.png"
-        )) 
-
-    async def ptrackNotifyLeft(self, user: int, userdata: dict, serverdata: dict):
-        user = self.bot.get_user(user)
-        assert user is not None
+            ))
 
-        await user.send(embed=discord.Embed(
+        await recipient.send(embed=discord.Embed(
             title="STK Player Tracker",
-            description=(
-                "{country} {username} left.\n"
-                "Server: {serverCountry} {server}"
-            ).format(
-                country=flagconverter(userdata["country-code"]),
-                username=userdata["username"],
-                serverCountry=flagconverter(serverdata["country_code"]),
-                server=str(serverdata["name"])
-                .replace("\r", "")
-                .replace("\n", "")
-            ),
+            description="\n\n".join(lines),
             color=self.bot.accent_color
         ).set_thumbnail(
             url="https://raw.githubusercontent.com/supertuxkart/stk-code/master/data/supertuxkart_256.png"
         ))
 
-    async def triggerDiff(self, tree: et.Element):
-
-        if not self.lastserverlist:
-            self.lastserverlist = tree
-
-        ids_old = set(int(x[0].attrib["id"]) for x in self.lastserverlist[0])
-        ids_new = set(int(x[0].attrib["id"]) for x in tree[0])
-
-        srvCreated = ids_new.difference(ids_old)
-        srvDeleted = ids_old.difference(ids_new)
-
-        playersToInsert = []
-        playersToInsertnocc = []
-
-        for i in range(len(tree[0])):
-
-            _id = int(tree[0][i][0].attrib["id"])
-
-            if _id in srvCreated:
-
-                log.info("New server created: %s (%s) with id %d and address %s:%d" % (
-                    tree[0][i][0].attrib['name'],
-                    tree[0][i][0].attrib['country_code'],
-                    int(tree[0][i][0].attrib['id']),
-                    bigip(int(tree[0][i][0].attrib['ip'])),
-                    int(tree[0][i][0].attrib['port'])
-                    ))
+    @staticmethod
+    def seenRow(player: Player, server: Server, date: datetime.datetime) -> tuple:
+        return (
+            player.username,
+            date,
+            server.name,
+            player.country_code.lower() if player.country_code else None,
+            server.country_code.lower() if server.country_code else None
+        )
 
-                playersJoined = tree[0][i][1]
+    async def writeSeen(self, rows: list[tuple]):
+        """Bulk upserts buffered rows into lina_discord_stk_seen."""
+        async with self.bot.pool.acquire() as con:
+            async with con.transaction():
+                await con.execute("""
+                CREATE TEMPORARY TABLE IF NOT EXISTS lina_discord_stk_seen_buffer
+                (LIKE lina_discord_stk_seen) ON COMMIT DELETE ROWS
+                """)
+                await con.copy_records_to_table(
+                    "lina_discord_stk_seen_buffer",
+                    records=rows,
+                    columns=("username", "date", "server_name", "country", "server_country")
+                )
+                await con.execute("""
+                INSERT INTO lina_discord_stk_seen (username, date, server_name, country, server_country)
+                SELECT username, date, server_name, country, server_country
+                FROM lina_discord_stk_seen_buffer
+                ON CONFLICT (username) DO UPDATE SET
+                    date = EXCLUDED.date,
+                    server_name = EXCLUDED.server_name,
+                    country = COALESCE(EXCLUDED.country, lina_discord_stk_seen.country),
+                    server_country = EXCLUDED.server_country
+                """)
+
+    async def triggerDiff(self, snapshot: Snapshot, diff: Optional[ServerListDiff] = None):
+
+        if self.lastserverlist is None:
+            # First tick: only learn who is online, don't notify anyone.
+            self.lastserverlist = snapshot
+            for player, server in snapshot.players():
+                self.onlinePlayers[player.username] = server
+                self.bot.online.usernameIndex.add(player.username)
+            return
+
+        if diff is None:
+            with tracing.span("diff"):
+                diff = await self.bot.offload.run("diff", diff_server_lists, self.lastserverlist, snapshot)
+
+        now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+        # Discord user ID -> tracked events of this tick
+        notifications: dict[int, list[tuple[str, Player, Server]]] = {}
+
+        for serverInfo in diff.created:
+            log.info("New server created: %s (%s) with id %d and address %s:%d" % (
+                serverInfo.name,
+                serverInfo.country_code,
+                serverInfo.id,
+                bigip(serverInfo.ip),
+                serverInfo.port
+            ))
+
+        for serverInfo in diff.deleted:
+            log.info("Server deleted: %s (%s) with id %d and address %s:%d" % (
+                serverInfo.name,
+                serverInfo.country_code,
+                serverInfo.id,
+                bigip(serverInfo.ip),
+                serverInfo.port
+            ))
+
+        for serverInfo, oldTrack, newTrack in diff.track_changed:
+            if not oldTrack:
+                log.info("Stub: Game started at %s %s - %s" % (
+                    serverInfo.name,
+                    serverInfo.id,
+                    self.bot.online.convertAddonIdToName(newTrack)
+                ))
+            elif not newTrack:
+                log.info("Stub: Game ended at %s %s" % (
+                    serverInfo.name,
+                    serverInfo.id
+                ))
 
-                for player in playersJoined:
+        for serverInfo, changed in diff.config_changed:
+            log.info("Stub: Config difference detected at %s: %s"
+                % (serverInfo.name, set(changed)))
 
-                    username = player.attrib["username"]
-                    country = player.attrib["country-code"]
-                    serverInfo = tree[0][i][0]
-                    serverName = serverInfo.attrib["name"]
-                    serverCountry = serverInfo.attrib['country_code']
-                    playersToInsert.append((username, country,
-                                        serverName, serverCountry))
+        with tracing.span("seen"):
+            for player, serverInfo in diff.left:
+                self.seenBuffer.add(player.username, self.seenRow(player, serverInfo, now))
+            for player, serverInfo in diff.joined:
+                self.seenBuffer.add(player.username, self.seenRow(player, serverInfo, now))
 
-                    if username not in self.onlinePlayers:
-                        self.onlinePlayers[username] = serverInfo
+        with tracing.span("cache"):
+            for player, serverInfo in diff.joined:
+                self.bot.online.addUserToCache(player.user_id, player.username)
 
-        for i in range(len(self.lastserverlist[0])):
+        with tracing.span("notify"):
+            # Leaves go first so a player hopping servers within one tick
+            # ends up in onlinePlayers with their new server.
+            for player, serverInfo in diff.left:
+                for subscriber in self.trackedPlayers.get(player.username, ()):
+                    notifications.setdefault(subscriber, []).append(("left", player, serverInfo))
 
-            _id = int(self.lastserverlist[0][i][0].attrib["id"])
+                self.onlinePlayers.pop(player.username, None)
 
-            if _id in srvDeleted:
+            for player, serverInfo in diff.joined:
+                for subscriber in self.trackedPlayers.get(player.username, ()):
+                    notifications.setdefault(subscriber, []).append(("joined", player, serverInfo))
 
-                log.info("Server deleted: %s (%s) with id %d and address %s:%d" % (
-                    self.lastserverlist[0][i][0].attrib['name'],
-                    self.lastserverlist[0][i][0].attrib['country_code'],
-                    int(self.lastserverlist[0][i][0].attrib['id']),
-                    bigip(int(self.lastserverlist[0][i][0].attrib['ip'])),
-                    int(self.lastserverlist[0][i][0].attrib['port'])
-                ))
+                self.onlinePlayers[player.username] = serverInfo
 
-                playersLeft = self.lastserverlist[0][i][1]
+            for subscriber, events in notifications.items():
+                self.dispatcher.submit(subscriber, events)
 
-                for player in playersLeft:
-                    username = player.attrib['username']
-                    serverInfo = self.lastserverlist[0][i][0]
-                    serverName = serverInfo.attrib['name']
-                    serverCountry = serverInfo.attrib['country_code']
+        self.lastserverlist = snapshot
 
-                    playersToInsertnocc.append((username,
-                                                serverName,
-                                                serverCountry))
-
-                    if username in self.onlinePlayers:
-                        del self.onlinePlayers[username]
+    @tasks.loop(seconds=5)
+    async def fetcherWrapper(self):
+        profiler = self.profiler
+        with profiler or contextlib.nullcontext(), tracing.trace("tick") as tick:
+            await self.runTick()
 
-        # Some optimization procedure stuff
-        pairs = {}
-        offset = 0
+        self.finishTick(tick, profiler)
 
-        for i in range(min(len(tree[0]), len(self.lastserverlist[0]))):
-            _id_next = int(tree[0][i][0].attrib['id'])
+    def finishTick(self, tick: tracing.Trace, profiler: Optional[TickProfiler]):
+        if profiler is not None and profiler.finished:
+            self.profiler = None
 
-            try:
-                _id_prev = int(self.lastserverlist[0][i + offset][0].attrib['id'])
-            except IndexError:
-                log.error(
-                "Bad index: prevTree[0][%s][0] is out of boundaries, offset %s, i=%s, len(tree[0]) = %s, len(prevTree[0] = %s)" % (
-                    i + offset,
-                    offset,
-                    i,
-                    len(tree[0]),
-                    len(self.lastserverlist[0])
-                ))
-                continue
-
-            if _id_next == _id_prev:
-                pairs[tree[0][i]] = self.lastserverlist[0][i + offset]
-            elif _id_next in srvCreated:
-                offset -= 1
-            elif len(tree[0]) != len(self.lastserverlist[0]):
-                while _id_prev in srvDeleted:
-                    _id_prev = int(self.lastserverlist[0][i + offset][0].attrib['id'])
-                    if _id_prev in srvDeleted:
-                        offset += 1
-                    elif _id_prev == _id_next:
-                        pairs[tree[0][i]] = self.lastserverlist[0][i + offset]
-                        break
-                    else:
-                        log.error(
-                            "Failed to find an offset at _id_next %s" % _id_next)
-
-        for pair in pairs:
-            oldServerInfo = pairs[pair][0]
-            oldServerPlayers = pairs[pair][1]
-            serverInfo = pair[0]
-            serverPlayers = pair[1]
-
-            if serverInfo.attrib['id'] != oldServerInfo.attrib['id']:
-                log.warn("Server IDs don't match: %s %s" % (
-                    serverInfo.attrib['id'],
-                    oldServerInfo.attrib['id']
-                ))
-                continue
-
-            serverCTrack = None
-            oldserverCTrack = None
-            if "current_track" in serverInfo.attrib:
-                serverCTrack = serverInfo.attrib["current_track"]
-            if "current_track" in oldServerInfo.attrib:
-                oldserverCTrack = oldServerInfo.attrib["current_track"]
-
-            if serverCTrack != oldserverCTrack:
-                if not oldserverCTrack:
-                    log.info("Stub: Game started at %s %s - %s" % (
-                        serverInfo.attrib['name'],
-                        serverInfo.attrib['id'],
-                        serverCTrack
-                    ))
-                elif not serverCTrack:
-                    log.info(
-                        "Stub: Game ended at %s %s" % (
-                            serverInfo.attrib['name'],
-                            serverInfo.attrib['id']
-                        ))
-            diff_attrib = set()
-            for attrib in ('max_players',
-                       'game_mode',
-                       'difficulty'):
-                if serverInfo.attrib[attrib] != oldServerInfo.attrib[attrib]:
-                    diff_attrib.add(attrib)
-
-            if diff_attrib:
-                log.info("Stub: Config difference detected at %s: %s"
-                    % (serverInfo.attrib['name'], diff_attrib))
-
-            playersNew = set(str(x.attrib['username']) for x in serverPlayers)
-            playersOld = set(str(x.attrib['username']) for x in oldServerPlayers)
-            playersJoined = playersNew.difference(playersOld)
-            playersLeft = playersOld.difference(playersNew)
-
-            for i in range(len(serverPlayers)):
-                username = serverPlayers[i].attrib['username']
-                userid = int(serverPlayers[i].attrib['user-id'])
-                userCountryCode = serverPlayers[i].attrib['country-code'].lower() if 'country-code' in serverPlayers[i].attrib else ''
-
-                if username in playersJoined:
-                    if 'country-code' in serverPlayers[i].attrib:
-
-                        serverName = serverInfo.attrib['name']
-                        serverCountry = serverInfo.attrib['country_code']
-
-                        playersToInsert.append((
-                            username,
-                            userCountryCode,
-                            serverName,
-                            serverCountry
-                        )) 
-
-                    await self.bot.online.addUserToCache(userid, username)
-
-                    async with self.bot.pool.acquire() as con:
-                        for e in await con.fetch("SELECT * FROM lina_discord_ptrack;"):
-                            if username in e["usernames"]:
-                                self.bot.loop.create_task(self.ptrackNotifyJoin(
-                                    e["id"],
-                                    serverPlayers[i].attrib,
-                                    serverInfo.attrib
-                                ))
-
-
-                    self.onlinePlayers[username] = serverInfo
-
-            for i in range(len(oldServerPlayers)):
-                if i >= len(oldServerPlayers):
-                    log.warning(
-                    "Impossible happened: iteration %s is over oldServerPlayers length: %s"
-                    % (i, len(oldServerPlayers)))
-                    continue
-
-                username = oldServerPlayers[i].attrib['username']
-                userCountryCode = oldServerPlayers[i].attrib['country-code']
-
-                if username in playersLeft:
-                    if 'country-code' in oldServerPlayers[i].attrib:
-
-                        serverName = oldServerInfo.attrib['name']
-                        serverCountry = oldServerInfo.attrib['country_code']
-
-                        playersToInsert.append((
-                            username,
-                            userCountryCode,
-                            serverName,
-                            serverCountry
-                        ))
-
-                    async with self.bot.pool.acquire() as con:
-                        for e in await con.fetch("SELECT * FROM lina_discord_ptrack;"):
-                            if username in e["usernames"]:
-                                self.bot.loop.create_task(self.ptrackNotifyLeft(
-                                    e["id"],
-                                    oldServerPlayers[i].attrib,
-                                    oldServerInfo.attrib
-                                ))
-
-
-                    if username in self.onlinePlayers:
-                        del self.onlinePlayers[username]
-
-            if len(oldServerPlayers) != len(serverPlayers):
-                log.info(
-                f"Stub: Server {serverName} became full or free")
+        if tick.duration > self.slowTickBudget:
+            log.warning("Slow tick: %.1fms (%s)", tick.duration * 1000, tick.breakdown())
 
+    async def runTick(self):
         try:
-            if playersToInsertnocc:
-                async with self.bot.pool.acquire() as con:
-                    sel = await con.prepare("""
-INSERT INTO lina_discord_stk_seen (username, date, server_name, server_country)
-VALUES ($1, now() at time zone 'utc', $2, lower($3))
-ON CONFLICT (username) DO UPDATE SET
-date = now() at time zone 'utc', server_name = $2, server_country = lower($3);
-""")
-                    await sel.executemany(playersToInsertnocc)
-            if playersToInsert:
-                async with self.bot.pool.acquire() as con:
-                    sel = await con.prepare("""
-INSERT INTO lina_discord_stk_seen (username, country, date, server_name, server_country)
-VALUES ($1, lower($2), now() at time zone 'utc', $3, lower($4))
-ON CONFLICT (username) DO UPDATE SET
-country = lower($2), date = now() at time zone 'utc',
-server_name = $3, server_country = lower($4);
-""")
-                    await sel.executemany(playersToInsert)
-
-
-            playersToInsert.clear()
-            playersToInsertnocc.clear()
-        except Exception as e:
-            log.exception(
-                f"Unable to save player info to DB: {e.__class__.__name__}: {e}")
-
-        self.lastserverlist = self.serverlist
-
-    @tasks.loop(seconds=5)
-    async def fetcherWrapper(self):
-        try:    
-            self.serverlist = await self.bot.stkGetReq("/api/v2/server/get-all")
+            snapshot, self.fingerprint = await self.bot.stkGetServerList(self.fingerprint)
         except Exception:
             log.exception("Failed to get server list.")
+            return
+
+        if snapshot is None:
+            self.unchangedTicks += 1
+            metrics.serverlist_unchanged.inc()
+            log.debug("Server list unchanged, skipping diff.")
+            return
+
+        await self.applySnapshot(snapshot)
+
+    async def applySnapshot(self, snapshot: Snapshot, diff: Optional[ServerListDiff] = None):
+        self.serverlist = snapshot
 
         try:
-            await self.triggerDiff(self.serverlist)
+            with metrics.triggerdiff_seconds.time():
+                await self.triggerDiff(self.serverlist, diff)
         except Exception:
             log.exception("Error at triggerDiff")
 
-    def cog_load(self):
-        self.fetcherWrapper.start()
+    async def handlePollerMessage(self, message: PollerMessage):
+        """Applies a tick of the poller process, see utils.poller."""
+        profiler = self.profiler
+        with profiler or contextlib.nullcontext(), tracing.trace("tick") as tick:
+            for name, seconds in message.spans:
+                tracing.record(f"poller.{name}", seconds)
+                if name == "parse":
+                    metrics.serverlist_parse_seconds.observe(seconds)
+
+            if message.kind == "error":
+                log.error("Poller process failed to get server list:\n%s", message.error)
+            elif message.kind == "unchanged":
+                self.unchangedTicks += 1
+                metrics.serverlist_unchanged.inc()
+            else:
+                # After a restart of the poller, or if a snapshot got lost,
+                # its diff is not against our last snapshot.
+                diff = message.diff if message.seq == self.pollerSeq + 1 else None
+                self.pollerSeq = message.seq
+                await self.applySnapshot(message.snapshot, diff)
+
+        self.finishTick(tick, profiler)
+
+    async def cog_load(self):
+        await self.buildTrackIndex()
+        self.dispatcher.start()
+        self.seenBuffer.start()
+        if getattr(constants, "POLLER_PROCESS", False):
+            poller = PollerProcess(self.bot.stk.base_url, self.bot.scheduler, self.handlePollerMessage)
+            try:
+                poller.start()
+            except ValueError:
+                log.exception("Request limits too low for a poller process, polling in the bot instead.")
+            else:
+                self.poller = poller
 
-    def cog_unload(self):
+        if self.poller is None:
+            self.fetcherWrapper.start()
+
+    async def cog_unload(self):
         self.fetcherWrapper.cancel()
+        if self.poller is not None:
+            await self.poller.stop()
+        await self.dispatcher.stop()
+        await self.seenBuffer.stop()
 
     @commands.hybrid_command(name="stk-seen", aliases=["seen"], description="See when user was last online")
     @app_commands.describe(player="Player to check")
     async def stk_seen(self, interaction: commands.Context, player: str):
-        sql_esc = str.maketrans({
-            "%": "\\%",
-            "_": "\\_",
-            "\\": "\\\\"
-        })
+        player = player.strip()
+        if not player:
+            return await interaction.reply(embed=discord.Embed(
+                title="Error",
+                description="Please give me the name of a player.",
+                color=self.bot.accent_color
+            ), mention_author=False)
+
+        clause, args = prefix_clause("lower(username)", player.lower())
 
         try: 
-            data = await self.bot.pool.fetchrow("""SELECT username, LOWER(country) AS country,
+            data = await self.bot.pool.fetchrow(f"""SELECT username, LOWER(country) AS country,
                                             date, server_name, LOWER(server_country) AS server_country FROM lina_discord_stk_seen
-                                            WHERE username ILIKE $1 GROUP BY username FETCH FIRST 1 ROW ONLY""",
-                                            player.translate(sql_esc) + "%")
+                                            {clause} FETCH FIRST 1 ROW ONLY""",
+                                            *args)
         except Exception:
             log.exception("Could not get stk-seen data for query {player}")
             return await interaction.reply(embed=discord.Embed(
@@ -393,7 +361,8 @@ server_name = $3, server_country = lower($4);
             ), mention_author=False)
 
         if data:
-            if data["username"] in self.onlinePlayers:
+            server = self.onlinePlayers.get(data["username"])
+            if server is not None:
                 return await interaction.reply(embed=discord.Embed(
                     title="{country} {username} is currently online.".format(
                         country=flagconverter(data["country"]),
@@ -401,8 +370,8 @@ server_name = $3, server_country = lower($4);
                     ),
 
                     description="Currently in server: {country} {name}".format(
-                        country=flagconverter(data["server_country"]),
-                        name=str(data["server_name"]).replace("\r", "").replace("\n", "")
+                        country=flagconverter(server.country_code),
+                        name=server.name.replace("\r", "").replace("\n", "")
                     ),
                     color=self.bot.accent_color
                 ), mention_author=False)
@@ -430,6 +399,10 @@ server_name = $3, server_country = lower($4);
                 color=self.bot.accent_color
             ), mention_author=False)
 
+    @stk_seen.autocomplete("player")
+    async def stk_seen_autocomplete(self, interaction: discord.Interaction, current: str):
+        return self.bot.online.usernameChoices(current)
+
     @app_commands.command(name="trackuser", description="Track a user.")
     @app_commands.describe(player="The player to track.")
     async def trackuser(self, interaction: discord.Interaction, player: str):
@@ -471,6 +444,7 @@ server_name = $3, server_country = lower($4);
             ON CONFLICT (id) DO UPDATE SET
             usernames = array_append(lina_discord_ptrack.usernames, $3)
             """, interaction.user.id, {player}, player)
+            self.trackIndexAdd(interaction.user.id, player)
 
             await interaction.response.send_message(embed=discord.Embed(
                 title=f"Tracking {player} privately.",
@@ -489,6 +463,10 @@ server_name = $3, server_country = lower($4);
             ), ephemeral=True)
 
 
+    @trackuser.autocomplete("player")
+    async def trackuser_autocomplete(self, interaction: discord.Interaction, current: str):
+        return self.bot.online.usernameChoices(current)
+
     @app_commands.command(name="untrackuser", description="No longer track a user")
     @app_commands.describe(player="The player you're tracking to not track anymore")
     async def untrackuser(self, interaction: discord.Interaction, player: str):
@@ -520,6 +498,7 @@ server_name = $3, server_country = lower($4);
                 SET usernames = array_remove(lina_discord_ptrack.usernames, $1)
                 WHERE id = $2
                 """, player, interaction.user.id)
+                self.trackIndexRemove(interaction.user.id, player)
             except Exception:
                 log.exception(f"Could not remove player {player} from {interaction.user.id}")
                 return await interaction.response.send_message(embed=discord.Embed(
@@ -597,6 +576,7 @@ server_name = $3, server_country = lower($4);
                 """
                 UPDATE lina_discord_ptrack SET usernames = '{}' WHERE id = $1
                 """, interaction.user.id)
+                self.trackIndexClear(interaction.user.id)
             except Exception:
                 log.exception(f"Could not clear ptracks for user {interaction.user.id}")
                 return await interaction.edit_original_response(
@@ -95,6 +95,10 @@ async def initDatabase(pool: asyncpg.Pool) -> None:
                 rating float NOT NULL
             )
             """)
+            await con.execute("""
+            ALTER TABLE lina_discord_addons
+            ADD COLUMN IF NOT EXISTS removed boolean NOT NULL DEFAULT false
+            """)
 
             await con.execute("""
             CREATE TABLE IF NOT EXISTS lina_discord_stkusers (
@@ -103,6 +107,16 @@ async def initDatabase(pool: asyncpg.Pool) -> None:
             )
             """)
 
+            # Prefix lookups (stk-seen, username to ID) on lowercased names
+            await con.execute("""
+            CREATE INDEX IF NOT EXISTS lina_discord_stk_seen_username_prefix
+            ON lina_discord_stk_seen (lower(username) text_pattern_ops)
+            """)
+            await con.execute("""
+            CREATE INDEX IF NOT EXISTS lina_discord_stkusers_username_prefix
+            ON lina_discord_stkusers (lower(username) text_pattern_ops)
+            """)
+
 async def runBot():
     log = logging.getLogger()
     try:
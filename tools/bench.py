@@ -0,0 +1,252 @@
+"""
+Replay benchmark for the poll -> diff -> persist pipeline.
+
+Feeds recorded or synthetic ``/api/v2/server/get-all`` responses through
+the bot's own code: the chunked parser, then ``PlayerTrack.triggerDiff``
+with its stk-seen write buffer and notification dispatcher. Only the
+database and Discord are replaced by in-process stand-ins, so this runs
+offline. Buffers keep the flush settings the bot uses.
+
+Examples::
+
+    python -m tools.bench --servers 1000 --players 10000 --churn 0.05
+    python -m tools.bench --replay recordings/ --json before.json
+    python -m tools.bench --compare before.json
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import pathlib
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+import types
+from typing import Iterable, Optional
+
+try:
+    import constants  # noqa: F401
+except ModuleNotFoundError:
+    # The cogs import the bot's config, none of which the benchmark needs.
+    sys.modules["constants"] = types.ModuleType("constants")
+
+from cogs.online import Online
+from cogs.playertrack import PlayerTrack
+from utils import tracing
+from utils.offload import Offloader
+from utils.snapshot import parse_chunks
+from tools.synthetic import SyntheticServerList
+
+# Spans recorded by triggerDiff, plus parsing before and DM fanout after it
+STAGES = ("parse", "diff", "seen", "cache", "notify", "fanout")
+# What the transport reads the response body in
+CHUNK_SIZE = 16384
+
+
+class StandInDatabase:
+    """Accepts buffered stk-seen and stkusers rows like the real bulk upserts would."""
+
+    def __init__(self):
+        self.rows: dict[str, tuple] = {}
+        self.users: dict[int, str] = {}
+        self.writes = 0
+
+    async def writeSeen(self, rows: list[tuple]):
+        self.writes += 1
+        for row in rows:
+            self.rows[row[0]] = row
+
+    async def writeUsers(self, rows: list[tuple[int, str]]):
+        for userid, username in rows:
+            self.users.setdefault(userid, username)
+
+
+class StandInDiscord:
+    """Accepts DMs without sending them anywhere."""
+
+    def __init__(self):
+        self.messages = 0
+        self.events = 0
+
+    async def send(self, user: int, events: list):
+        self.messages += 1
+        self.events += len(events)
+
+
+class StandInBot:
+    """The parts of the bot that PlayerTrack and Online use while diffing."""
+
+    def __init__(self, db: StandInDatabase, dms: StandInDiscord):
+        self.offload = Offloader()
+        self.online = Online(self)
+        self.online.userWriter.write = db.writeUsers
+        self.playertrack = PlayerTrack(self)
+        self.playertrack.seenBuffer.write = db.writeSeen
+        self.playertrack.dispatcher.send = dms.send
+
+
+def recorded_ticks(directory: pathlib.Path) -> Iterable[bytes]:
+    files = sorted(directory.glob("*.xml"))
+    if not files:
+        raise SystemExit(f"No *.xml snapshots found in {directory}")
+    for file in files:
+        yield file.read_bytes()
+
+
+def summarize(samples: list[float]) -> dict:
+    ordered = sorted(samples)
+    return {
+        "mean": statistics.fmean(ordered),
+        "p50": ordered[len(ordered) // 2],
+        "p95": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+        "max": ordered[-1]
+    }
+
+
+async def run(ticks: Iterable[bytes], *, tracked: float, subscribers: int, memory: bool, seed: int) -> dict:
+    rng = random.Random(seed)
+    db = StandInDatabase()
+    dms = StandInDiscord()
+    bot = StandInBot(db, dms)
+    cog = bot.playertrack
+    cog.seenBuffer.start()
+    cog.dispatcher.start()
+    bot.online.userWriter.start()
+
+    timings = {stage: [] for stage in STAGES}
+    peaks = []
+    blocks = []
+    count = 0
+
+    if memory:
+        tracemalloc.start()
+
+    for body in ticks:
+        if memory:
+            tracemalloc.reset_peak()
+        allocated = sys.getallocatedblocks()
+        first = cog.lastserverlist is None
+
+        with tracing.trace("tick") as tick:
+            with tracing.span("parse"):
+                snapshot, _ = parse_chunks(body[i:i + CHUNK_SIZE] for i in range(0, len(body), CHUNK_SIZE))
+            await cog.triggerDiff(snapshot)
+
+        if first:
+            # Pick who is tracked from the first tick, like real subscribers would.
+            for player, _ in snapshot.players():
+                if rng.random() < tracked:
+                    for _ in range(rng.randint(1, 3)):
+                        cog.trackIndexAdd(rng.randrange(subscribers), player.username)
+            continue
+
+        start = time.perf_counter()
+        await cog.dispatcher.join()
+        tick.record("fanout", time.perf_counter() - start)
+
+        for name, seconds in tick.spans:
+            timings[name].append(seconds)
+
+        blocks.append(sys.getallocatedblocks() - allocated)
+        if memory:
+            peaks.append(tracemalloc.get_traced_memory()[1])
+        count += 1
+
+    if memory:
+        tracemalloc.stop()
+    await cog.dispatcher.stop()
+    await cog.seenBuffer.stop()
+    await bot.online.userWriter.stop()
+    bot.offload.shutdown()
+
+    if not count:
+        raise SystemExit("Need at least two ticks to benchmark.")
+
+    last = cog.lastserverlist
+    result = {
+        "ticks": count,
+        "servers": len(last),
+        "players": sum(len(x.players) for x in last),
+        "stages_ms": {
+            stage: {k: v * 1000 for k, v in summarize(samples).items()}
+            for stage, samples in timings.items()
+        },
+        # Blocks still allocated after each tick, not every allocation made during it
+        "block_growth_per_tick": statistics.fmean(blocks),
+        "rows_written": len(db.rows),
+        "seen_flushes": cog.seenBuffer.flushes,
+        "dms_sent": dms.messages,
+        "notify_events": dms.events
+    }
+    if peaks:
+        result["peak_memory_kib"] = max(peaks) / 1024
+    return result
+
+
+def report(result: dict, baseline: Optional[dict] = None):
+    print(f"{result['ticks']} ticks, {result['servers']} servers, {result['players']} players")
+    print(f"{'stage':<10} {'mean':>9} {'p50':>9} {'p95':>9} {'max':>9}  (ms)")
+    for stage, stats in result["stages_ms"].items():
+        line = f"{stage:<10} " + " ".join(f"{stats[k]:9.3f}" for k in ("mean", "p50", "p95", "max"))
+        if baseline is not None and stage in baseline["stages_ms"]:
+            before = baseline["stages_ms"][stage]["mean"]
+            if before:
+                line += f"  {(stats['mean'] - before) / before * 100:+.1f}% mean"
+        print(line)
+
+    print(f"live memory block growth per tick: {result['block_growth_per_tick']:.0f}")
+    if "peak_memory_kib" in result:
+        print(f"peak traced memory per tick: {result['peak_memory_kib']:.0f} KiB")
+    print(f"seen rows written: {result['rows_written']} in {result['seen_flushes']} flushes, "
+          f"DMs: {result['dms_sent']} ({result['notify_events']} events)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--replay", type=pathlib.Path, help="directory of recorded get-all *.xml snapshots")
+    parser.add_argument("--servers", type=int, default=1000)
+    parser.add_argument("--players", type=int, default=10000)
+    parser.add_argument("--churn", type=float, default=0.05, help="fraction of players changing per tick")
+    parser.add_argument("--server-churn", type=float, default=0.01)
+    parser.add_argument("--reorder", action="store_true", help="shuffle server order on every tick")
+    parser.add_argument("--ticks", type=int, default=50)
+    parser.add_argument("--tracked", type=float, default=0.05, help="fraction of players somebody tracks")
+    parser.add_argument("--subscribers", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--memory", action="store_true", help="trace peak memory (slows down timings)")
+    parser.add_argument("--json", type=pathlib.Path, help="write results to this file")
+    parser.add_argument("--compare", type=pathlib.Path, help="results file of a previous run to compare with")
+    args = parser.parse_args()
+
+    if args.replay:
+        ticks = recorded_ticks(args.replay)
+    else:
+        ticks = SyntheticServerList(
+            args.servers, args.players,
+            churn=args.churn,
+            server_churn=args.server_churn,
+            reorder=args.reorder,
+            seed=args.seed
+        ).ticks(args.ticks + 1)
+
+    result = asyncio.run(run(
+        ticks,
+        tracked=args.tracked,
+        subscribers=args.subscribers,
+        memory=args.memory,
+        seed=args.seed
+    ))
+
+    baseline = json.loads(args.compare.read_text()) if args.compare else None
+    report(result, baseline)
+
+    if args.json:
+        args.json.write_text(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
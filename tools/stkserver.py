@@ -0,0 +1,260 @@
+"""
+Local stand-in for the STK online API.
+
+Implements the endpoints lina uses, backed by synthetic or replayed data,
+so the bot can be load tested without touching online.supertuxkart.net.
+Point the bot at it by setting ``STK_API_URL`` in constants.py::
+
+    python -m tools.stkserver --port 8080 --servers 500 --players 5000
+    STK_API_URL = "http://127.0.0.1:8080"
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import itertools
+import logging
+import pathlib
+import random
+import secrets
+import time
+import zlib
+from typing import Optional
+from xml.sax.saxutils import quoteattr
+
+from aiohttp import web
+
+from tools.synthetic import TRACKS, SyntheticServerList
+
+log = logging.getLogger("lina.tools.stkserver")
+
+
+def element(tag: str, children: str = "", attrib: Optional[dict] = None, **kwargs) -> str:
+    """Renders an XML element. Underscores in keyword names become dashes."""
+    attrib = {**(attrib or {}), **{k.replace("_", "-"): v for k, v in kwargs.items()}}
+    attrs = "".join(f" {k}={quoteattr(str(v))}" for k, v in attrib.items())
+    if children:
+        return f"<{tag}{attrs}>{children}</{tag}>"
+    return f"<{tag}{attrs}/>"
+
+
+class StandInSTK:
+    """State and request handlers of the stand-in server."""
+
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.random = random.Random(args.seed)
+        self.sessions: dict[str, tuple[int, float]] = {}
+        self.requests = 0
+
+        if args.replay:
+            files = sorted(pathlib.Path(args.replay).glob("*.xml"))
+            if not files:
+                raise SystemExit(f"No *.xml snapshots found in {args.replay}")
+            self.replay = itertools.cycle(files)
+            self.serverlist = next(self.replay).read_bytes()
+            self.synthetic = None
+        else:
+            self.replay = None
+            self.synthetic = SyntheticServerList(
+                args.servers, args.players,
+                churn=args.churn,
+                server_churn=args.server_churn,
+                reorder=args.reorder,
+                seed=args.seed
+            )
+            self.serverlist = self.synthetic.render()
+
+    def users(self) -> dict[int, str]:
+        if self.synthetic is not None:
+            return {k: v[0] for k, v in self.synthetic.population.items()}
+        return {i: f"player{i}" for i in range(1, 1001)}
+
+    async def ticker(self):
+        """Advances the server list every ``--tick`` seconds."""
+        while True:
+            await asyncio.sleep(self.args.tick)
+            if self.synthetic is not None:
+                self.synthetic.step()
+                self.serverlist = self.synthetic.render()
+            else:
+                self.serverlist = next(self.replay).read_bytes()
+
+    @web.middleware
+    async def chaos(self, request: web.Request, handler):
+        """Applies the configured latency and error injection."""
+        self.requests += 1
+
+        if self.args.latency_max:
+            await asyncio.sleep(self.random.uniform(self.args.latency_min, self.args.latency_max) / 1000)
+
+        if self.random.random() < self.args.error_rate:
+            raise web.HTTPInternalServerError(text="Injected error")
+
+        return await handler(request)
+
+    def reply(self, tag: str, children: str = "", **attrib) -> web.Response:
+        return web.Response(
+            text='<?xml version="1.0" encoding="UTF-8"?>\n' + element(tag, children, {"success": "yes"}, **attrib),
+            content_type="application/xml"
+        )
+
+    def fail(self, tag: str, info: str) -> web.Response:
+        return web.Response(
+            text='<?xml version="1.0" encoding="UTF-8"?>\n' + element(tag, success="no", info=info),
+            content_type="application/xml"
+        )
+
+    async def authenticate(self, request: web.Request, tag: str) -> tuple[Optional[dict], Optional[web.Response]]:
+        form = dict(await request.post())
+
+        if self.random.random() < self.args.stk_error_rate:
+            return None, self.fail(tag, "Injected STK error")
+
+        session = self.sessions.get(form.get("token", ""))
+        if session is None or str(session[0]) != form.get("userid") \
+                or (self.args.session_ttl and time.monotonic() - session[1] > self.args.session_ttl):
+            return None, self.fail(tag, "Session not valid. Please sign in.")
+
+        return form, None
+
+    async def connect(self, request: web.Request):
+        form = await request.post()
+        username = form.get("username", "")
+        if not username:
+            return self.fail("connect", "Username or password is invalid")
+
+        userid = zlib.crc32(username.encode()) % 100000 + 1
+        token = secrets.token_hex(12)
+        self.sessions[token] = (userid, time.monotonic())
+        return self.reply("connect", token=token, username=username,
+                          realname=username, userid=userid, achieved="")
+
+    async def poll(self, request: web.Request):
+        form, error = await self.authenticate(request, "poll")
+        return error or self.reply("poll")
+
+    async def client_quit(self, request: web.Request):
+        form, error = await self.authenticate(request, "client-quit")
+        if error:
+            return error
+        self.sessions.pop(form["token"], None)
+        return self.reply("client-quit")
+
+    async def get_all(self, request: web.Request):
+        response = web.Response(body=self.serverlist, content_type="application/xml")
+        # Compressed if the client asks for it, like the real thing
+        response.enable_compression()
+        return response
+
+    async def top_players(self, request: web.Request):
+        form, error = await self.authenticate(request, "top-players")
+        if error:
+            return error
+
+        players = "".join(
+            element("player", username=name, scores=2000 - i * 25.5, max_scores=2100 - i * 20.25,
+                    num_races_done=500 - i, raw_scores=2500 - i * 30, rating_deviation=100 + i)
+            for i, name in enumerate(list(self.users().values())[:10])
+        )
+        return self.reply("top-players", element("players", players))
+
+    async def user_search(self, request: web.Request):
+        form, error = await self.authenticate(request, "user-search")
+        if error:
+            return error
+
+        query = form.get("search-string", "").lower()
+        users = "".join(
+            element("user", attrib={"id": userid, "user_name": name})
+            for userid, name in itertools.islice(
+                ((k, v) for k, v in self.users().items() if query in v.lower()), 50)
+        )
+        return self.reply("user-search", element("users", users))
+
+    async def get_friends_list(self, request: web.Request):
+        form, error = await self.authenticate(request, "get-friends-list")
+        if error:
+            return error
+
+        users = self.users()
+        rng = random.Random(form.get("visitingid"))
+        friends = "".join(
+            element("friend", element("user", attrib={"id": userid, "user_name": users[userid]}),
+                    is_online="no", date="2024-01-01")
+            for userid in rng.sample(list(users), min(len(users), rng.randrange(60)))
+        )
+        return self.reply("get-friends-list", element("friends", friends), visitingid=form.get("visitingid", ""))
+
+    async def get_ranking(self, request: web.Request):
+        form, error = await self.authenticate(request, "get-ranking")
+        if error:
+            return error
+
+        rng = random.Random(form.get("id"))
+        return self.reply("get-ranking", scores=rng.uniform(1000, 3000), max_scores=rng.uniform(3000, 3500),
+                          num_races_done=rng.randrange(1000), raw_scores=rng.uniform(1000, 4000),
+                          rating_deviation=rng.uniform(50, 500), disconnects=rng.randrange(100),
+                          rank=rng.randrange(0, 5000))
+
+    async def online_assets(self, request: web.Request):
+        tracks = "".join(
+            element("track", id=track, name=track.replace("_", " ").title(), file=f"{track}.zip",
+                    date=1600000000 + i, uploader="lina", designer="lina", description="",
+                    image="", format=7, revision=1, status=0, size=1024 * (i + 1), rating=2.5)
+            for i, track in enumerate(TRACKS)
+        )
+        return web.Response(text=element("assets", tracks), content_type="application/xml")
+
+
+def make_app(args: argparse.Namespace) -> web.Application:
+    stk = StandInSTK(args)
+    app = web.Application(middlewares=[stk.chaos])
+    app.add_routes([
+        web.post("/api/v2/user/connect", stk.connect),
+        web.post("/api/v2/user/poll", stk.poll),
+        web.post("/api/v2/user/client-quit", stk.client_quit),
+        web.post("/api/v2/user/top-players", stk.top_players),
+        web.post("/api/v2/user/user-search", stk.user_search),
+        web.post("/api/v2/user/get-friends-list", stk.get_friends_list),
+        web.post("/api/v2/user/get-ranking", stk.get_ranking),
+        web.get("/api/v2/server/get-all", stk.get_all),
+        web.get("/downloads/xml/online_assets.xml", stk.online_assets),
+    ])
+
+    async def ticker(app: web.Application):
+        task = asyncio.create_task(stk.ticker())
+        yield
+        task.cancel()
+
+    app.cleanup_ctx.append(ticker)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--replay", help="directory of recorded get-all *.xml snapshots to cycle through")
+    parser.add_argument("--servers", type=int, default=100)
+    parser.add_argument("--players", type=int, default=1000)
+    parser.add_argument("--churn", type=float, default=0.05)
+    parser.add_argument("--server-churn", type=float, default=0.01)
+    parser.add_argument("--reorder", action="store_true")
+    parser.add_argument("--tick", type=float, default=5.0, help="seconds between server list changes")
+    parser.add_argument("--latency-min", type=float, default=0.0, help="minimum added latency in ms")
+    parser.add_argument("--latency-max", type=float, default=0.0, help="maximum added latency in ms")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with HTTP 500")
+    parser.add_argument("--stk-error-rate", type=float, default=0.0,
+                        help="fraction of authenticated requests answered with success=\"no\"")
+    parser.add_argument("--session-ttl", type=float, default=0.0, help="expire sessions after this many seconds")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    web.run_app(make_app(args), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+Synthetic ``/api/v2/server/get-all`` responses.
+
+Used by the benchmark and the local STK stand-in server to produce a
+server list of any size that changes a little on every tick.
+"""
+
+from __future__ import annotations
+
+import random
+from typing import Iterator, Optional
+from xml.sax.saxutils import quoteattr
+
+TRACKS = (
+    "abyss", "black_forest", "candela_city", "cocoa_temple", "cornfield_crossing",
+    "fortmagma", "gran_paradiso_island", "hacienda", "lighthouse", "mines",
+    "minigolf", "olivermath", "ravenbridge_mansion", "sandtrack", "scotland",
+    "snowmountain", "snowtuxpeak", "stk_enterprise", "volcano_island",
+    "xr591", "zengarden", "icy_soccer_field", "soccer_field", "battleisland"
+)
+COUNTRIES = ("de", "fr", "us", "br", "pl", "ru", "id", "jp", "es", "it", "nl", "gb")
+
+
+class SyntheticServerList:
+    """
+    A fake public server list.
+
+    ``churn`` is the fraction of online players that leave (and are
+    replaced by joining players) on every tick, ``server_churn`` the
+    fraction of servers that are deleted and recreated.
+    """
+
+    def __init__(
+        self,
+        servers: int = 100,
+        players: int = 1000,
+        *,
+        churn: float = 0.05,
+        server_churn: float = 0.01,
+        reorder: bool = False,
+        seed: Optional[int] = 0
+    ):
+        self.random = random.Random(seed)
+        self.churn = churn
+        self.server_churn = server_churn
+        self.reorder = reorder
+        self.next_server_id = 1
+        # Everyone who may ever come online: user ID -> (username, country)
+        self.population = {
+            i: (f"player{i}", self.random.choice(COUNTRIES))
+            for i in range(1, players * 2 + 1)
+        }
+        # server ID -> server attributes
+        self.servers: dict[int, dict] = {}
+        # server ID -> user IDs of its players
+        self.players: dict[int, list[int]] = {}
+        self.offline = list(self.population)
+        self.random.shuffle(self.offline)
+
+        for _ in range(servers):
+            self._create_server()
+
+        for _ in range(players):
+            self._join(self.random.choice(list(self.servers)))
+
+    def _create_server(self) -> int:
+        _id = self.next_server_id
+        self.next_server_id += 1
+        self.servers[_id] = {
+            "id": str(_id),
+            "host_id": str(_id),
+            "name": f"Synthetic server {_id}",
+            "max_players": "16",
+            "ip": str(self.random.randrange(1 << 24, 1 << 32)),
+            "ipv6": "",
+            "port": str(self.random.randrange(2759, 65535)),
+            "private_port": "0",
+            "difficulty": str(self.random.randrange(4)),
+            "game_mode": str(self.random.randrange(7)),
+            "current_players": "0",
+            "current_ai": "0",
+            "password": "0",
+            "version": "6",
+            "game_started": "0",
+            "country_code": self.random.choice(COUNTRIES).upper(),
+            "current_track": "",
+            "distance": "0"
+        }
+        self.players[_id] = []
+        return _id
+
+    def _delete_server(self, _id: int):
+        del self.servers[_id]
+        self.offline.extend(self.players.pop(_id))
+
+    def _join(self, server: int):
+        if self.offline:
+            self.players[server].append(self.offline.pop())
+
+    def _leave(self, server: int):
+        players = self.players[server]
+        if players:
+            self.offline.insert(0, players.pop(self.random.randrange(len(players))))
+
+    def step(self):
+        """Advances the server list by one tick."""
+        servers = list(self.servers)
+
+        for _id in self.random.sample(servers, int(len(servers) * self.server_churn)):
+            self._delete_server(_id)
+            self._create_server()
+
+        servers = list(self.servers)
+        online = sum(len(x) for x in self.players.values())
+        for _ in range(int(online * self.churn)):
+            self._leave(self.random.choice(servers))
+            self._join(self.random.choice(servers))
+
+        for _id in self.random.sample(servers, max(1, len(servers) // 20)):
+            self.servers[_id]["current_track"] = (
+                "" if self.servers[_id]["current_track"] else self.random.choice(TRACKS)
+            )
+
+    def render(self) -> bytes:
+        """Renders the current state as a get-all response body."""
+        servers = list(self.servers)
+        if self.reorder:
+            self.random.shuffle(servers)
+
+        out = ['<?xml version="1.0" encoding="UTF-8"?>\n<servers success="yes" info=""><servers>']
+        for _id in servers:
+            info = self.servers[_id]
+            info["current_players"] = str(len(self.players[_id]))
+            out.append("<server><server-info ")
+            out.append(" ".join(f"{k}={quoteattr(v)}" for k, v in info.items()))
+            out.append("/><players>")
+            for user in self.players[_id]:
+                username, country = self.population[user]
+                out.append(
+                    f'<player-info user-id="{user}" username={quoteattr(username)} '
+                    f'time-played="1.0" country-code="{country}" ranked="0" scores="0" '
+                    'max-scores="0" num-races-done="0"/>'
+                )
+            out.append("</players></server>")
+        out.append("</servers></servers>")
+        return "".join(out).encode()
+
+    def ticks(self, count: int) -> Iterator[bytes]:
+        """Yields ``count`` consecutive response bodies."""
+        for _ in range(count):
+            yield self.render()
+            self.step()
@@ -0,0 +1,87 @@
+from __future__ import annotations
+
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Iterable, Optional
+
+from utils.scheduler import TokenBucket
+
+
+class STKAccount:
+    """
+    An STK account the bot logs in with, and the state of its session.
+
+    Only healthy accounts are handed out for requests. An account is
+    healthy once logged in, and stops being so when STK rejects its
+    session, until it is logged in again.
+    """
+
+    def __init__(self, username: str, password: str, *, rate: float = 2.0, burst: int = 4):
+        self.username = username
+        self.password = password
+        self.userid: Optional[str] = None
+        self.token: Optional[str] = None
+        self.healthy = False
+        # Bumped on every login, to tell which session a failed request used
+        self.generation = 0
+        self.started = 0.0
+        self.lock = asyncio.Lock()
+        self.login_attempt = 0.0
+        self.login_error: Optional[Exception] = None
+        self.bucket = TokenBucket(rate, burst)
+        self.inflight = 0
+        self.requests = 0
+
+    def __repr__(self) -> str:
+        return f"<STKAccount {self.username} healthy={self.healthy} inflight={self.inflight}>"
+
+    @property
+    def credentials(self) -> str:
+        return f"userid={self.userid}&token={self.token}"
+
+    @property
+    def logged_in(self) -> bool:
+        return self.token is not None
+
+
+class AccountPool:
+    """
+    Spreads authenticated requests over several STK accounts.
+
+    Each request goes to the healthy account with the fewest requests in
+    flight, preferring accounts that have rate budget left. If no account
+    is healthy, all of them are candidates, so the request gets to log
+    one in again.
+    """
+
+    def __init__(self, accounts: Iterable[STKAccount]):
+        self.accounts = list(accounts)
+        if not self.accounts:
+            raise ValueError("At least one STK account is required.")
+
+    def __iter__(self):
+        return iter(self.accounts)
+
+    def __len__(self) -> int:
+        return len(self.accounts)
+
+    def healthy(self) -> list[STKAccount]:
+        return [account for account in self.accounts if account.healthy]
+
+    def pick(self) -> STKAccount:
+        candidates = self.healthy() or self.accounts
+        return min(candidates, key=lambda a: (a.bucket.available < 1, a.inflight, a.requests))
+
+    @asynccontextmanager
+    async def lease(self, account: Optional[STKAccount] = None):
+        """Picks an account (unless given one) and waits for its rate budget."""
+        if account is None:
+            account = self.pick()
+
+        account.inflight += 1
+        try:
+            await account.bucket.wait()
+            account.requests += 1
+            yield account
+        finally:
+            account.inflight -= 1
@@ -0,0 +1,151 @@
+from __future__ import annotations
+
+import re
+from typing import Iterable, Optional
+
+from utils.addons import Addon
+from utils.prefixindex import PrefixIndex
+
+# Addon status flags, see stk-code src/addons/addon.hpp
+STATUS_FLAGS = {
+    "approved": 0x0001,
+    "alpha": 0x0002,
+    "beta": 0x0004,
+    "rc": 0x0008,
+    "invisible": 0x0010,
+    "hq": 0x0020,
+    "dfsg": 0x0040,
+    "featured": 0x0080,
+}
+
+# How much a token found in each field counts towards the score.
+FIELD_WEIGHTS = (
+    ("id", 4),
+    ("name", 4),
+    ("designer", 2),
+    ("uploader", 2),
+    ("description", 1),
+)
+
+_token_re = re.compile(r"[^\W_]+")
+
+
+def tokenize(text: str) -> list[str]:
+    return _token_re.findall(text.lower())
+
+
+class AddonIndex:
+    """
+    In-memory inverted index over the addon catalogue.
+
+    Every token of an addon's name, designer, uploader and description
+    points to the addons containing it. Query tokens match index tokens
+    by prefix, so partially typed words work for autocomplete.
+    """
+
+    def __init__(self, addons: Iterable[Addon] = ()):
+        self.addons: dict[str, Addon] = {}
+        # token -> addon ID -> field weight
+        self._postings: dict[str, dict[str, int]] = {}
+        self._vocabulary = PrefixIndex()
+        for addon in addons:
+            self.update(addon)
+
+    def __len__(self) -> int:
+        return len(self.addons)
+
+    def update(self, addon: Addon):
+        """Adds an addon, replacing a previous version of it."""
+        self.remove(addon.id)
+        self.addons[addon.id] = addon
+
+        weights: dict[str, int] = {}
+        for field, weight in FIELD_WEIGHTS:
+            for token in tokenize(getattr(addon, field)):
+                weights[token] = max(weights.get(token, 0), weight)
+
+        for token, weight in weights.items():
+            postings = self._postings.get(token)
+            if postings is None:
+                postings = self._postings[token] = {}
+                self._vocabulary.add(token)
+            postings[addon.id] = weight
+
+    def remove(self, _id: str):
+        addon = self.addons.pop(_id, None)
+        if addon is None:
+            return
+
+        for field, _ in FIELD_WEIGHTS:
+            for token in tokenize(getattr(addon, field)):
+                postings = self._postings.get(token)
+                if postings is None:
+                    continue
+
+                postings.pop(_id, None)
+                if not postings:
+                    del self._postings[token]
+                    self._vocabulary.remove(token)
+
+    def search(
+        self,
+        query: str,
+        *,
+        status: Optional[int] = None,
+        format: Optional[int] = None,
+        max_size: Optional[int] = None,
+        include_invisible: bool = False,
+        limit: int = 25
+    ) -> list[Addon]:
+        """
+        Returns addons matching every word of ``query``, best first.
+
+        Results are ranked by match quality, then by rating. ``status``
+        is a mask of :data:`STATUS_FLAGS` that must all be set, and
+        ``max_size`` is in bytes.
+        """
+        query = query.strip().lower()
+        tokens = tokenize(query)
+
+        if tokens:
+            scores: Optional[dict[str, int]] = None
+            for token in tokens:
+                matches: dict[str, int] = {}
+                for candidate in self._vocabulary.search(token, limit=len(self._vocabulary)):
+                    bonus = 2 if candidate == token else 1
+                    for _id, weight in self._postings[candidate].items():
+                        matches[_id] = max(matches.get(_id, 0), weight * bonus)
+
+                if scores is None:
+                    scores = matches
+                else:
+                    scores = {k: v + matches[k] for k, v in scores.items() if k in matches}
+
+                if not scores:
+                    return []
+        else:
+            scores = dict.fromkeys(self.addons, 0)
+
+        results = []
+        for _id, score in scores.items():
+            addon = self.addons[_id]
+
+            if not include_invisible and addon.status & STATUS_FLAGS["invisible"]:
+                continue
+            if status is not None and addon.status & status != status:
+                continue
+            if format is not None and addon.format != format:
+                continue
+            if max_size is not None and addon.size > max_size:
+                continue
+
+            name = addon.name.lower()
+            if query and (name == query or addon.id == query):
+                score += 100
+            elif query and name.startswith(query):
+                score += 50
+
+            results.append((score, addon))
+
+        results.sort(key=lambda x: (-x[0], -x[1].rating, x[1].name.lower()))
+        return [addon for _, addon in results[:limit]]
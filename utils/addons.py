@@ -0,0 +1,73 @@
+from __future__ import annotations
+
+import xml.etree.ElementTree as et
+from typing import Iterable, Iterator, NamedTuple
+
+
+class Addon(NamedTuple):
+    """A track of the addon catalogue (``online_assets.xml``)."""
+
+    id: str
+    name: str
+    file: str
+    date: int
+    uploader: str
+    designer: str
+    description: str
+    image: str
+    format: int
+    revision: int
+    status: int
+    size: int
+    rating: float
+
+
+def make_addon(attrib: dict) -> Addon:
+    return Addon(
+        attrib["id"],
+        attrib["name"],
+        attrib["file"],
+        int(attrib["date"]),
+        attrib.get("uploader", ""),
+        attrib.get("designer", ""),
+        attrib.get("description", ""),
+        attrib.get("image", ""),
+        int(attrib["format"]),
+        int(attrib["revision"]),
+        int(attrib["status"]),
+        int(attrib["size"]),
+        float(attrib["rating"])
+    )
+
+
+def iter_addons(chunks: Iterable[bytes]) -> Iterator[Addon]:
+    """
+    Incrementally parses ``online_assets.xml`` and yields its tracks.
+
+    Elements are discarded as soon as they are read.
+    """
+    parser = et.XMLPullParser(events=("start", "end"))
+    root = None
+    depth = 0
+
+    def process():
+        nonlocal root, depth
+        for event, elem in parser.read_events():
+            if event == "start":
+                depth += 1
+                if root is None:
+                    root = elem
+                continue
+
+            depth -= 1
+            if depth == 1:
+                if elem.tag == "track":
+                    yield make_addon(elem.attrib)
+                root.clear()
+
+    for chunk in chunks:
+        parser.feed(chunk)
+        yield from process()
+
+    parser.close()
+    yield from process()
@@ -0,0 +1,162 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Generic, Hashable, NamedTuple, Optional, TypeVar
+
+from utils import metrics
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class Fingerprint(NamedTuple):
+    """Identifies one response body, to detect unchanged resources."""
+
+    digest: bytes
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+
+
+class LRUCache(Generic[K, V]):
+    """
+    Mapping that holds at most ``maxsize`` entries, evicting the least
+    recently used one when full. Counts hits and misses of :meth:`get`.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict[K, V] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: K) -> bool:
+        return key in self._data
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def get(self, key: K, default: Optional[V] = None) -> Optional[V]:
+        try:
+            value = self._data[key]
+        except KeyError:
+            self.misses += 1
+            return default
+
+        self.hits += 1
+        self._data.move_to_end(key)
+        return value
+
+    def peek(self, key: K, default: Optional[V] = None) -> Optional[V]:
+        """Like :meth:`get`, but neither counts nor refreshes the entry."""
+        return self._data.get(key, default)
+
+    def put(self, key: K, value: V):
+        self._data[key] = value
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key: K, default: Any = None):
+        return self._data.pop(key, default)
+
+    def clear(self):
+        self._data.clear()
+
+
+class _Entry(NamedTuple):
+    expires: float
+    value: Any
+    error: Optional[BaseException]
+
+
+class ResponseCache:
+    """
+    TTL cache for the results of coroutines, with single-flight fetching.
+
+    Concurrent lookups of a missing key share one call of ``fetch``
+    instead of each making their own. Exceptions of the ``negative``
+    types are cached too (for ``negative_ttl`` seconds) and re-raised to
+    everyone asking within that time; any other exception is only passed
+    on to the callers waiting for that one call.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 1024,
+        *,
+        negative: tuple[type[BaseException], ...] = (),
+        negative_ttl: float = 10.0,
+        name: str = "cache"
+    ):
+        self.negative = negative
+        self.negative_ttl = negative_ttl
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._entries: LRUCache[Hashable, _Entry] = LRUCache(maxsize)
+        self._inflight: dict[Hashable, asyncio.Future] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses + self.coalesced
+        return (self.hits + self.coalesced) / total if total else 0.0
+
+    async def get(self, key: Hashable, fetch: Callable[[], Awaitable[V]], ttl: float) -> V:
+        entry = self._entries.peek(key)
+        if entry is not None:
+            if entry.expires > time.monotonic():
+                self.hits += 1
+                metrics.stk_cache_requests.labels(cache=self.name, result="hit").inc()
+                if entry.error is not None:
+                    raise entry.error
+                return entry.value
+            self._entries.pop(key)
+
+        task = self._inflight.get(key)
+        if task is None:
+            self.misses += 1
+            metrics.stk_cache_requests.labels(cache=self.name, result="miss").inc()
+            task = asyncio.ensure_future(self._fill(key, fetch, ttl))
+            task.add_done_callback(_consume)
+            self._inflight[key] = task
+        else:
+            self.coalesced += 1
+            metrics.stk_cache_requests.labels(cache=self.name, result="coalesced").inc()
+
+        # A caller giving up must not cancel the call the others wait for
+        return await asyncio.shield(task)
+
+    def invalidate(self, key: Hashable):
+        self._entries.pop(key)
+
+    def clear(self):
+        self._entries.clear()
+
+    async def _fill(self, key: Hashable, fetch: Callable[[], Awaitable[V]], ttl: float) -> V:
+        try:
+            value = await fetch()
+        except self.negative as e:
+            self._entries.put(key, _Entry(time.monotonic() + self.negative_ttl, None, e))
+            raise
+        else:
+            self._entries.put(key, _Entry(time.monotonic() + ttl, value, None))
+            return value
+        finally:
+            self._inflight.pop(key, None)
+
+
+def _consume(task: asyncio.Future):
+    # Nobody may be left waiting for the result; don't warn about it then.
+    if not task.cancelled():
+        task.exception()
@@ -0,0 +1,117 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Optional
+
+from utils import metrics
+
+log = logging.getLogger("lina.utils.dispatcher")
+
+
+def retry_after(exc: Exception) -> Optional[float]:
+    """
+    Returns how long to wait before retrying if ``exc`` is a rate limit
+    error, or None otherwise.
+    """
+    delay = getattr(exc, "retry_after", None)
+    if delay is not None:
+        return float(delay)
+
+    if getattr(exc, "status", None) != 429:
+        return None
+
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        return float(headers.get("Retry-After", 1))
+    except ValueError:
+        return 1.0
+
+
+class NotificationDispatcher:
+    """
+    Delivers batched notifications through a fixed pool of workers.
+
+    Every submitted batch is sent with a single call to ``send``. When a
+    send is rate limited, all workers pause for the requested time before
+    the batch is retried.
+    """
+
+    def __init__(
+        self,
+        send: Callable[[int, list[Any]], Awaitable[Any]],
+        *,
+        workers: int = 4,
+        max_retries: int = 3
+    ):
+        self.send = send
+        self.workers = workers
+        self.max_retries = max_retries
+        self.sent = 0
+        self.failed = 0
+        self._queue: asyncio.Queue[tuple[int, list[Any]]] = asyncio.Queue()
+        self._tasks: list[asyncio.Task] = []
+        self._resume_at = 0.0
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    def start(self):
+        if self._tasks:
+            return
+
+        self._tasks = [
+            asyncio.create_task(self._worker(), name=f"lina-dispatcher-{i}")
+            for i in range(self.workers)
+        ]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+
+    async def join(self):
+        """Waits until every queued batch has been handled."""
+        await self._queue.join()
+
+    def submit(self, recipient: int, events: list[Any]):
+        """Queues one batch of events for a recipient."""
+        self._queue.put_nowait((recipient, events))
+
+    async def _worker(self):
+        while True:
+            recipient, events = await self._queue.get()
+            try:
+                await self._deliver(recipient, events)
+            finally:
+                self._queue.task_done()
+
+    async def _deliver(self, recipient: int, events: list[Any]):
+        for attempt in range(self.max_retries + 1):
+            delay = self._resume_at - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+            try:
+                with metrics.dm_send_seconds.time():
+                    await self.send(recipient, events)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                delay = retry_after(e)
+                if delay is None or attempt == self.max_retries:
+                    self.failed += 1
+                    log.error("Could not notify %d: %s: %s",
+                              recipient, e.__class__.__name__, e)
+                    return
+
+                log.warning("Rate limited while notifying %d, retrying in %.2fs",
+                            recipient, delay)
+                self._resume_at = max(self._resume_at, time.monotonic() + delay)
+            else:
+                self.sent += 1
+                return
@@ -19,6 +19,15 @@ def bigip(x: int):
     return '.'.join([str(y) for y in int.to_bytes(int(x), 4, 'big')])
 
 
+def humanize_size(size: int):
+    """Converts a size in bytes to a human-readable format"""
+    for unit in ("B", "KiB", "MiB"):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GiB"
+
+
 def humanize_timedelta(
     *, timedelta: Optional[datetime.timedelta] = None, seconds: Optional[SupportsInt] = None
 ) -> str:
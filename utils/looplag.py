@@ -0,0 +1,87 @@
+from __future__ import annotations
+
+import asyncio
+import collections
+import logging
+import sys
+import threading
+import time
+import traceback
+from typing import Optional
+
+from utils import metrics
+
+log = logging.getLogger("lina.utils.looplag")
+
+
+class LoopLagMonitor:
+    """
+    Measures how late the event loop gets around to its callbacks.
+
+    A task sleeps for ``interval`` seconds at a time and records how much
+    later than asked it woke up. A watchdog thread watches those wakeups;
+    once the loop has been stuck for more than ``threshold`` seconds, it
+    logs the stack of the loop's thread, which shows the callback that is
+    blocking it.
+    """
+
+    def __init__(self, *, interval: float = 0.25, threshold: float = 0.5, window: int = 2400):
+        self.interval = interval
+        self.threshold = threshold
+        self.samples: collections.deque[float] = collections.deque(maxlen=window)
+        self.stalls = 0
+        self._beat = time.monotonic()
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+        self._loop_thread = 0
+
+    def start(self):
+        if self._task is not None:
+            return
+
+        self._loop_thread = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stopped.clear()
+        self._task = asyncio.create_task(self._sample(), name="lina-looplag")
+        self._thread = threading.Thread(target=self._watch, name="lina-looplag-watchdog", daemon=True)
+        self._thread.start()
+
+    async def stop(self):
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def percentile(self, q: float) -> float:
+        """Lag (in seconds) that ``q`` percent of the recent samples stay below."""
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * q / 100))]
+
+    async def _sample(self):
+        while True:
+            start = time.monotonic()
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(0.0, now - start - self.interval)
+            self.samples.append(lag)
+            metrics.loop_lag_seconds.observe(lag)
+            self._beat = now
+
+    def _watch(self):
+        reported = None
+        while not self._stopped.wait(self.threshold / 2):
+            beat = self._beat
+            stuck = time.monotonic() - beat - self.interval
+            if stuck < self.threshold or beat == reported:
+                continue
+
+            # Once per stall: the stack tells which callback holds the loop
+            reported = beat
+            self.stalls += 1
+            frame = sys._current_frames().get(self._loop_thread)
+            stack = "".join(traceback.format_stack(frame)) if frame is not None else "(unavailable)\n"
+            log.warning("Event loop blocked for over %.0fms, currently at:\n%s", stuck * 1000, stack)
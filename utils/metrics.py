@@ -0,0 +1,234 @@
+"""
+Minimal Prometheus metrics.
+
+Metrics are registered in a module level registry and exposed in the
+Prometheus text format by :func:`start_server`.
+"""
+
+from __future__ import annotations
+
+import bisect
+import logging
+import math
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator, Optional
+
+log = logging.getLogger("lina.utils.metrics")
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_registry: list[Metric] = []
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: tuple[tuple[str, str], ...]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels) + "}"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+class Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._children: dict[tuple[tuple[str, str], ...], Metric] = {}
+        self._labels: tuple[tuple[str, str], ...] = ()
+        _registry.append(self)
+
+    def labels(self, **labels: str):
+        key = tuple((name, str(labels[name])) for name in self.labelnames)
+        child = self._children.get(key)
+        if child is None:
+            child = object.__new__(type(self))
+            child._init_child(self, key)
+            self._children[key] = child
+        return child
+
+    def _init_child(self, parent: Metric, labels: tuple[tuple[str, str], ...]):
+        self.name = parent.name
+        self._labels = labels
+
+    def _samples(self) -> Iterator[str]:
+        raise NotImplementedError
+
+    def collect(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.type}"
+        if self.labelnames:
+            for child in self._children.values():
+                yield from child._samples()
+        else:
+            yield from self._samples()
+
+
+class Counter(Metric):
+    """A counter, exposed as ``<name>_total`` in every line of its family."""
+
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        if not name.endswith("_total"):
+            name += "_total"
+        super().__init__(name, documentation, labelnames)
+        self.value = 0.0
+
+    def _init_child(self, parent, labels):
+        super()._init_child(parent, labels)
+        self.value = 0.0
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+    def _samples(self):
+        yield f"{self.name}{_format_labels(self._labels)} {_format_value(self.value)}"
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.value = 0.0
+        self._function: Optional[Callable[[], float]] = None
+
+    def _init_child(self, parent, labels):
+        super()._init_child(parent, labels)
+        self.value = 0.0
+        self._function = None
+
+    def set(self, value: float):
+        self.value = value
+
+    def set_function(self, function: Callable[[], float]):
+        """Reads the value from ``function`` every time it is scraped."""
+        self._function = function
+
+    def _samples(self):
+        value = self.value
+        if self._function is not None:
+            try:
+                value = self._function()
+            except Exception:
+                log.exception("Could not read gauge %s", self.name)
+                return
+        yield f"{self.name}{_format_labels(self._labels)} {_format_value(value)}"
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = (),
+                 buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets) + (math.inf,)
+        super().__init__(name, documentation, labelnames)
+        self._reset()
+
+    def _init_child(self, parent, labels):
+        super()._init_child(parent, labels)
+        self.buckets = parent.buckets
+        self._reset()
+
+    def _reset(self):
+        self.counts = [0] * len(self.buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def _samples(self):
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            labels = _format_labels(self._labels + (("le", _format_value(bound)),))
+            yield f"{self.name}_bucket{labels} {cumulative}"
+        yield f"{self.name}_sum{_format_labels(self._labels)} {_format_value(self.sum)}"
+        yield f"{self.name}_count{_format_labels(self._labels)} {self.count}"
+
+
+def render() -> str:
+    """Renders every registered metric in the Prometheus text format."""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.collect())
+    return "\n".join(lines) + "\n"
+
+
+async def start_server(host: str, port: int):
+    """Serves ``/metrics`` over HTTP. Returns the runner to clean up with."""
+    from aiohttp import web
+
+    async def handler(request: web.Request):
+        return web.Response(text=render(), content_type="text/plain", charset="utf-8",
+                            headers={"X-Content-Type-Options": "nosniff"})
+
+    app = web.Application()
+    app.router.add_get("/metrics", handler)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    log.info("Serving metrics on http://%s:%d/metrics", host, port)
+    return runner
+
+
+# Metrics of lina's hot paths.
+
+stk_request_seconds = Histogram(
+    "lina_stk_request_seconds", "Latency of requests to the STK API.", ("endpoint",))
+serverlist_parse_seconds = Histogram(
+    "lina_serverlist_parse_seconds", "Time spent parsing the server list.")
+serverlist_unchanged = Counter(
+    "lina_serverlist_unchanged", "Polls skipped because the server list did not change.")
+stk_accounts = Gauge(
+    "lina_stk_accounts", "STK accounts in and out of rotation.", ("state",))
+stk_request_retries = Counter(
+    "lina_stk_request_retries", "Requests to the STK API that were tried again.", ("endpoint",))
+stk_scheduler_wait_seconds = Histogram(
+    "lina_stk_scheduler_wait_seconds", "Time requests to the STK API waited for a slot.", ("priority",))
+stk_scheduler_shed = Counter(
+    "lina_stk_scheduler_shed", "Requests to the STK API shed under load.", ("priority",))
+stk_scheduler_requests = Gauge(
+    "lina_stk_scheduler_requests", "Requests to the STK API running or waiting.", ("state",))
+stk_cache_requests = Counter(
+    "lina_stk_cache_requests", "Lookups of the STK response cache.", ("cache", "result"))
+triggerdiff_seconds = Histogram(
+    "lina_triggerdiff_seconds", "Duration of PlayerTrack.triggerDiff.")
+db_flush_seconds = Histogram(
+    "lina_db_flush_seconds", "Duration of write-behind buffer flushes.", ("buffer",))
+db_flush_rows = Counter(
+    "lina_db_flush_rows", "Rows written by write-behind buffer flushes.", ("buffer",))
+dm_send_seconds = Histogram(
+    "lina_dm_send_seconds", "Latency of sending player track DMs.")
+notification_queue_depth = Gauge(
+    "lina_notification_queue_depth", "Player track notification batches waiting to be sent.")
+loop_lag_seconds = Histogram(
+    "lina_loop_lag_seconds", "How late the event loop ran a scheduled wakeup.")
+online_players = Gauge(
+    "lina_online_players", "Players currently online on public servers.")
+cached_stk_users = Gauge(
+    "lina_cached_stk_users", "Entries in the STK user ID cache.")
+db_pool_connections = Gauge(
+    "lina_db_pool_connections", "Connections of the PostgreSQL pool.", ("state",))
@@ -0,0 +1,61 @@
+from __future__ import annotations
+
+import asyncio
+import concurrent.futures
+import logging
+import multiprocessing
+from typing import Any, Callable, Optional, TypeVar
+
+log = logging.getLogger("lina.utils.offload")
+
+T = TypeVar("T")
+
+MODES = ("inline", "thread", "process")
+
+
+class Offloader:
+    """
+    Runs CPU-bound stages off the event loop, as configured per stage.
+
+    ``modes`` maps a stage name to "inline" (run on the event loop, the
+    default), "thread" (a thread pool) or "process" (a process pool, for
+    picklable functions and arguments only). The pools are created the
+    first time a stage needs them.
+    """
+
+    def __init__(self, modes: Optional[dict[str, str]] = None, *, workers: int = 2):
+        self.modes = dict(modes or {})
+        self.workers = workers
+        self._threads: Optional[concurrent.futures.ThreadPoolExecutor] = None
+        self._processes: Optional[concurrent.futures.ProcessPoolExecutor] = None
+
+        for stage, mode in self.modes.items():
+            if mode not in MODES:
+                raise ValueError(f"Unknown offload mode {mode!r} for stage {stage!r}, "
+                                 f"expected one of {', '.join(MODES)}")
+
+    def executor(self, stage: str) -> Optional[concurrent.futures.Executor]:
+        mode = self.modes.get(stage, "inline")
+        if mode == "thread":
+            if self._threads is None:
+                self._threads = concurrent.futures.ThreadPoolExecutor(
+                    self.workers, thread_name_prefix="lina-offload")
+            return self._threads
+        if mode == "process":
+            if self._processes is None:
+                self._processes = concurrent.futures.ProcessPoolExecutor(
+                    self.workers, mp_context=multiprocessing.get_context("spawn"))
+            return self._processes
+        return None
+
+    async def run(self, stage: str, func: Callable[..., T], *args: Any) -> T:
+        executor = self.executor(stage)
+        if executor is None:
+            return func(*args)
+        return await asyncio.get_running_loop().run_in_executor(executor, func, *args)
+
+    def shutdown(self):
+        for executor in (self._threads, self._processes):
+            if executor is not None:
+                executor.shutdown(wait=False, cancel_futures=True)
+        self._threads = self._processes = None
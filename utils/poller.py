@@ -0,0 +1,221 @@
+"""
+Server list polling in a separate process.
+
+The worker process fetches, parses and diffs the server list and sends
+the results to the bot over a pipe, so a heavy tick never holds up the
+bot's event loop. :class:`PollerProcess` runs the worker from the bot
+side and restarts it when it crashes or stops responding. The worker's
+requests count against a share of the bot's request limits, and its log
+records are handled by the bot's loggers.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import logging.handlers
+import multiprocessing
+import time
+import traceback
+from multiprocessing.connection import Connection
+from typing import Awaitable, Callable, NamedTuple, Optional
+
+from utils import tracing
+from utils.cache import Fingerprint
+from utils.scheduler import Budget, Priority, RequestScheduler
+from utils.serverdiff import ServerListDiff, diff_server_lists
+from utils.snapshot import Snapshot, parse_chunks
+from utils.transport import STKTransport
+
+log = logging.getLogger("lina.utils.poller")
+
+SERVER_LIST = "/api/v2/server/get-all"
+
+# Request limits lent to the worker, enough for one poll every few seconds
+# with a retry.
+DEFAULT_BUDGET = Budget(concurrency=1, rate=1.0, burst=2)
+
+
+class PollerMessage(NamedTuple):
+    """
+    One tick of the worker.
+
+    ``kind`` is "snapshot" (the list changed), "unchanged" or "error".
+    Snapshots are numbered by ``seq``, and ``diff`` is against the
+    snapshot numbered ``seq - 1``, or None for the first one.
+    """
+
+    kind: str
+    seq: int = 0
+    snapshot: Optional[Snapshot] = None
+    diff: Optional[ServerListDiff] = None
+    # (name, seconds) spans of the tick in the worker
+    spans: tuple[tuple[str, float], ...] = ()
+    error: Optional[str] = None
+
+
+def run_poller(
+    conn: Connection, logs: multiprocessing.Queue, base_url: str, budget: Budget, interval: float
+):
+    """Entry point of the worker process."""
+    root = logging.getLogger()
+    root.handlers = [logging.handlers.QueueHandler(logs)]
+    root.setLevel(logging.INFO)
+    try:
+        asyncio.run(_poll(conn, base_url, budget, interval))
+    except KeyboardInterrupt:
+        pass
+
+
+async def _poll(conn: Connection, base_url: str, budget: Budget, interval: float):
+    transport = STKTransport(base_url, RequestScheduler(
+        concurrency=budget.concurrency, rate=budget.rate, burst=budget.burst))
+    fingerprint: Optional[Fingerprint] = None
+    last: Optional[Snapshot] = None
+    seq = 0
+
+    try:
+        while True:
+            start = time.monotonic()
+            with tracing.trace("tick") as tick:
+                try:
+                    chunks, fingerprint = await transport.get_conditional(
+                        SERVER_LIST, fingerprint, priority=Priority.CRITICAL)
+
+                    if chunks is None:
+                        message = PollerMessage("unchanged", seq, spans=tuple(tick.spans))
+                    else:
+                        with tracing.span("parse"):
+                            snapshot, attrib = parse_chunks(chunks)
+                        if attrib.get("success") == "no":
+                            raise RuntimeError(attrib.get("info", "get-all failed"))
+
+                        with tracing.span("diff"):
+                            diff = diff_server_lists(last, snapshot) if last is not None else None
+
+                        seq += 1
+                        last = snapshot
+                        message = PollerMessage("snapshot", seq, snapshot, diff, tuple(tick.spans))
+                except Exception:
+                    fingerprint = None
+                    message = PollerMessage("error", seq, error=traceback.format_exc())
+
+            # Snapshot and diff share their records, so they pickle together compactly
+            conn.send(message)
+            await asyncio.sleep(max(0.0, interval - (time.monotonic() - start)))
+    finally:
+        await transport.close()
+
+
+class _ForwardHandler(logging.Handler):
+    """Hands records of the worker to the bot's logger of the same name."""
+
+    def emit(self, record: logging.LogRecord):
+        logging.getLogger(record.name).handle(record)
+
+
+class PollerProcess:
+    """
+    Runs the worker process and hands its messages to ``handle``.
+
+    The worker is restarted, with exponential backoff, whenever it exits
+    or sends nothing for ``timeout`` seconds. While running, ``budget``
+    is lent from ``scheduler`` to the worker.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        scheduler: RequestScheduler,
+        handle: Callable[[PollerMessage], Awaitable[None]],
+        *,
+        budget: Budget = DEFAULT_BUDGET,
+        interval: float = 5.0,
+        timeout: float = 60.0
+    ):
+        self.base_url = base_url
+        self.scheduler = scheduler
+        self.handle = handle
+        self.budget = budget
+        self.interval = interval
+        self.timeout = timeout
+        self.restarts = 0
+        self.process: Optional[multiprocessing.Process] = None
+        self._task: Optional[asyncio.Task] = None
+        # Never fork the bot process with its event loop and threads
+        self._context = multiprocessing.get_context("spawn")
+
+    @property
+    def alive(self) -> bool:
+        return self.process is not None and self.process.is_alive()
+
+    def start(self):
+        """
+        Starts the worker. Raises ValueError if ``scheduler`` cannot spare
+        the budget.
+        """
+        if self._task is None:
+            self.scheduler.lend(self.budget)
+            self._task = asyncio.create_task(self._supervise(), name="lina-poller")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+            self.scheduler.restore(self.budget)
+
+    async def _supervise(self):
+        backoff = 1.0
+        while True:
+            started = time.monotonic()
+            try:
+                await self._run()
+            except (EOFError, OSError):
+                log.error("Poller process exited with code %s, restarting it.",
+                          self.process.exitcode if self.process else None)
+            except asyncio.TimeoutError:
+                log.error("Poller process sent nothing for %.0fs, restarting it.", self.timeout)
+            except Exception:
+                log.exception("Poller process failed, restarting it.")
+
+            if time.monotonic() - started > 60:
+                backoff = 1.0
+            self.restarts += 1
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 60.0)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        conn, child = self._context.Pipe(duplex=False)
+        # A new queue for every worker, a killed one may leave it locked
+        logs = self._context.Queue()
+        listener = logging.handlers.QueueListener(logs, _ForwardHandler())
+        process = self._context.Process(
+            target=run_poller, args=(child, logs, self.base_url, self.budget, self.interval),
+            name="lina-poller", daemon=True
+        )
+        process.start()
+        child.close()
+        listener.start()
+        self.process = process
+        log.info("Started poller process %d.", process.pid)
+
+        try:
+            while True:
+                # Unpickling happens on the executor thread too
+                message = await asyncio.wait_for(
+                    loop.run_in_executor(None, conn.recv), self.timeout)
+                try:
+                    await self.handle(message)
+                except Exception:
+                    log.exception("Could not handle poller message.")
+        finally:
+            if process.is_alive():
+                process.terminate()
+            await loop.run_in_executor(None, process.join, 5)
+            if process.is_alive():
+                process.kill()
+            conn.close()
+            await loop.run_in_executor(None, listener.stop)
+            logs.close()
@@ -0,0 +1,92 @@
+from __future__ import annotations
+
+import bisect
+import sys
+from typing import Iterable, Iterator, Optional
+
+
+def prefix_bounds(prefix: str) -> tuple[str, Optional[str]]:
+    """
+    Returns the half-open range [low, high) of strings starting with
+    ``prefix``, for index-friendly prefix queries.
+
+    ``high`` is None when there is no upper bound, which is the case for
+    an empty prefix or one made only of the highest code point.
+    """
+    stem = prefix.rstrip(chr(sys.maxunicode))
+    if not stem:
+        return prefix, None
+    return prefix, stem[:-1] + chr(ord(stem[-1]) + 1)
+
+
+def prefix_clause(column: str, prefix: str) -> tuple[str, list[str]]:
+    """
+    Returns a WHERE and ORDER BY clause matching rows whose ``column``
+    starts with ``prefix``, in order, and the arguments of the clause.
+
+    The clause only uses the pattern operators (``~>=~``, ``~<~``), so a
+    ``text_pattern_ops`` index on ``column`` serves both the range and
+    the order.
+    """
+    low, high = prefix_bounds(prefix)
+    if high is None:
+        return f"WHERE {column} ~>=~ $1 ORDER BY {column} USING ~<~", [low]
+    return f"WHERE {column} ~>=~ $1 AND {column} ~<~ $2 ORDER BY {column} USING ~<~", [low, high]
+
+
+class PrefixIndex:
+    """
+    Case-insensitive sorted index of names for prefix lookups.
+
+    Lookups are a binary search, so they stay fast enough for
+    autocomplete no matter how many names are known. With a ``maxsize``,
+    only that many of the most recently added names are kept.
+    """
+
+    def __init__(self, names: Iterable[str] = (), *, maxsize: Optional[int] = None):
+        self.maxsize = maxsize
+        # lowercased name -> name, least recently added first
+        self._names: dict[str, str] = {}
+        for name in names:
+            self._names.pop(name.lower(), None)
+            self._names[name.lower()] = name
+        if maxsize is not None:
+            for key in list(self._names)[:-maxsize or None]:
+                del self._names[key]
+        self._keys: list[str] = sorted(self._names)
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def __iter__(self) -> Iterator[str]:
+        return (self._names[key] for key in self._keys)
+
+    def __contains__(self, name: str) -> bool:
+        return name.lower() in self._names
+
+    def add(self, name: str):
+        key = name.lower()
+        if self._names.pop(key, None) is None:
+            bisect.insort(self._keys, key)
+        self._names[key] = name
+
+        if self.maxsize is not None and len(self._names) > self.maxsize:
+            self.remove(next(iter(self._names)))
+
+    def remove(self, name: str):
+        key = name.lower()
+        if self._names.pop(key, None) is None:
+            return
+        del self._keys[bisect.bisect_left(self._keys, key)]
+
+    def search(self, prefix: str, limit: int = 25) -> list[str]:
+        """Returns up to ``limit`` names starting with ``prefix``, in order."""
+        prefix = prefix.lower()
+        start = bisect.bisect_left(self._keys, prefix)
+        results = []
+        for i in range(start, min(start + limit, len(self._keys))):
+            key = self._keys[i]
+            if not key.startswith(prefix):
+                break
+            results.append(self._names[key])
+        return results
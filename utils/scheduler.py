@@ -0,0 +1,241 @@
+from __future__ import annotations
+
+import asyncio
+import enum
+import heapq
+import itertools
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import NamedTuple, Optional
+
+from utils import metrics
+
+log = logging.getLogger("lina.utils.scheduler")
+
+
+class Priority(enum.IntEnum):
+    """Priority classes of outbound requests, most important first."""
+
+    # Session keepalive, login and the server list poll
+    CRITICAL = 0
+    # Requests made on behalf of a user's command
+    INTERACTIVE = 1
+    # Background syncs that can wait
+    BULK = 2
+
+
+class SchedulerOverloaded(Exception):
+    """Raised when a request is shed instead of being queued or waited for."""
+    pass
+
+
+class Budget(NamedTuple):
+    """A share of the request limits, see :meth:`RequestScheduler.lend`."""
+
+    concurrency: int
+    rate: float
+    burst: int
+
+
+class TokenBucket:
+    """Allows ``rate`` events per second on average, in bursts of up to ``burst``."""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(float(self.burst), self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    @property
+    def available(self) -> float:
+        self._refill()
+        return self._tokens
+
+    def resize(self, rate: float, burst: int):
+        self._refill()
+        self.rate = rate
+        self.burst = burst
+        self._tokens = min(self._tokens, float(burst))
+
+    def delay(self) -> float:
+        """Seconds until the next token is available."""
+        return max(0.0, (1 - self.available) / self.rate)
+
+    def take(self) -> bool:
+        self._refill()
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+    async def wait(self):
+        """Waits for a token and takes it."""
+        while not self.take():
+            await asyncio.sleep(self.delay())
+
+
+class RequestScheduler:
+    """
+    Admission control for outbound requests.
+
+    At most ``concurrency`` requests run at once, and requests are started
+    at no more than ``rate`` per second on average (a token bucket holding
+    up to ``burst`` tokens). Waiting requests are started in priority
+    order. ``reserved`` slots are kept free for critical requests, so a
+    burst of commands can never starve the poll loop.
+
+    Non-critical requests are shed with :class:`SchedulerOverloaded` when
+    too many of their class are already waiting (``queue_limits``) or when
+    they waited longer than ``wait_limits`` allows.
+    """
+
+    def __init__(
+        self,
+        *,
+        concurrency: int = 4,
+        rate: float = 4.0,
+        burst: int = 8,
+        reserved: int = 1,
+        queue_limits: Optional[dict[Priority, int]] = None,
+        wait_limits: Optional[dict[Priority, float]] = None
+    ):
+        self.concurrency = concurrency
+        self.bucket = TokenBucket(rate, burst)
+        self._reserved = reserved
+        self.reserved = min(reserved, concurrency - 1)
+        self.queue_limits = {Priority.INTERACTIVE: 50, Priority.BULK: 10, **(queue_limits or {})}
+        self.wait_limits = {Priority.INTERACTIVE: 10.0, **(wait_limits or {})}
+        self.shed = dict.fromkeys(Priority, 0)
+
+        self._active = 0
+        self._queued = dict.fromkeys(Priority, 0)
+        self._waiters: list[tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    def queued(self, priority: Optional[Priority] = None) -> int:
+        if priority is None:
+            return sum(self._queued.values())
+        return self._queued[priority]
+
+    def lend(self, budget: Budget):
+        """
+        Gives up part of the limits, for a scheduler that sends requests
+        to the same API from elsewhere (such as another process), so both
+        together stay within the original limits.
+
+        Raises ValueError if that would leave nothing for this scheduler.
+        """
+        if (budget.concurrency >= self.concurrency or budget.rate >= self.bucket.rate
+                or budget.burst >= self.bucket.burst):
+            raise ValueError(
+                f"Cannot lend {budget} out of concurrency={self.concurrency}, "
+                f"rate={self.bucket.rate}, burst={self.bucket.burst}")
+        self._resize(-budget.concurrency, -budget.rate, -budget.burst)
+
+    def restore(self, budget: Budget):
+        """Takes back limits given away with :meth:`lend`."""
+        self._resize(budget.concurrency, budget.rate, budget.burst)
+
+    def _resize(self, concurrency: int, rate: float, burst: int):
+        self.concurrency += concurrency
+        self.reserved = min(self._reserved, self.concurrency - 1)
+        self.bucket.resize(self.bucket.rate + rate, self.bucket.burst + burst)
+        log.info("Request limits are now concurrency=%d, rate=%.2f, burst=%d",
+                 self.concurrency, self.bucket.rate, self.bucket.burst)
+        if self._waiters:
+            self._wake()
+
+    @asynccontextmanager
+    async def slot(self, priority: Priority = Priority.INTERACTIVE):
+        """Waits for permission to send a request, and holds it while inside."""
+        await self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+    async def acquire(self, priority: Priority = Priority.INTERACTIVE):
+        if not self._waiters and self._can_run(priority):
+            self._take()
+            metrics.stk_scheduler_wait_seconds.labels(priority=priority.name.lower()).observe(0.0)
+            return
+
+        limit = self.queue_limits.get(priority)
+        if limit is not None and self._queued[priority] >= limit:
+            self._shed(priority, "queue full")
+
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), fut))
+        self._queued[priority] += 1
+        start = time.monotonic()
+        self._wake()
+
+        try:
+            await asyncio.wait_for(fut, self.wait_limits.get(priority))
+        except BaseException as e:
+            if fut.done() and not fut.cancelled():
+                # The slot was granted just as we stopped waiting, give it back
+                self.release()
+            else:
+                fut.cancel()
+                self._queued[priority] -= 1
+
+            if isinstance(e, asyncio.TimeoutError):
+                self._shed(priority, "waited too long")
+            raise
+
+        metrics.stk_scheduler_wait_seconds.labels(priority=priority.name.lower()).observe(
+            time.monotonic() - start)
+
+    def release(self):
+        self._active -= 1
+        self._wake()
+
+    def _shed(self, priority: Priority, reason: str):
+        self.shed[priority] += 1
+        metrics.stk_scheduler_shed.labels(priority=priority.name.lower()).inc()
+        log.warning("Shedding %s request: %s (%d running, %d waiting)",
+                    priority.name.lower(), reason, self._active, self.queued())
+        raise SchedulerOverloaded(f"Too many requests to STK are waiting ({reason}).")
+
+    def _can_run(self, priority: Priority) -> bool:
+        limit = self.concurrency if priority == Priority.CRITICAL else self.concurrency - self.reserved
+        return self._active < limit and self.bucket.available >= 1
+
+    def _take(self):
+        self._active += 1
+        self.bucket.take()
+
+    def _wake(self):
+        while self._waiters:
+            priority, _, fut = self._waiters[0]
+            if fut.done():
+                heapq.heappop(self._waiters)
+                continue
+            if not self._can_run(priority):
+                break
+
+            heapq.heappop(self._waiters)
+            self._queued[priority] -= 1
+            self._take()
+            fut.set_result(None)
+
+        if self._waiters and self._timer is None:
+            delay = self.bucket.delay()
+            if delay > 0:
+                self._timer = asyncio.get_running_loop().call_later(delay, self._tick)
+
+    def _tick(self):
+        self._timer = None
+        self._wake()
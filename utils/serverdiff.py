@@ -0,0 +1,76 @@
+from __future__ import annotations
+
+from typing import NamedTuple, Optional
+
+from utils.snapshot import Player, Server, Snapshot
+
+# Server attributes that are reported as configuration changes.
+CONFIG_ATTRIBUTES = ("max_players", "game_mode", "difficulty")
+
+
+class ServerListDiff(NamedTuple):
+    """Result of comparing two server list snapshots."""
+
+    created: list[Server]
+    deleted: list[Server]
+    # (player, server) pairs
+    joined: list[tuple[Player, Server]]
+    left: list[tuple[Player, Server]]
+    # (server, changed attribute names) pairs
+    config_changed: list[tuple[Server, frozenset[str]]]
+    # (server, old track, new track) triples
+    track_changed: list[tuple[Server, Optional[str], Optional[str]]]
+
+
+def diff_server_lists(old: Snapshot, new: Snapshot) -> ServerListDiff:
+    """
+    Compares two server list snapshots.
+
+    Servers are matched by their ID, so the order in which they are
+    returned does not matter. Players of created servers are reported
+    as joined, and players of deleted servers as left.
+    """
+
+    diff = ServerListDiff([], [], [], [], [], [])
+
+    for server in new:
+        previous = old.get(server.id)
+
+        if previous is None:
+            diff.created.append(server)
+            diff.joined.extend((player, server) for player in server.players)
+            continue
+
+        changed = frozenset(
+            attrib for attrib in CONFIG_ATTRIBUTES
+            if getattr(server, attrib) != getattr(previous, attrib)
+        )
+        if changed:
+            diff.config_changed.append((server, changed))
+
+        track = server.current_track or None
+        old_track = previous.current_track or None
+        if track != old_track:
+            diff.track_changed.append((server, old_track, track))
+
+        if server.players == previous.players:
+            continue
+
+        before = {player.username for player in previous.players}
+        after = {player.username for player in server.players}
+
+        diff.joined.extend(
+            (player, server) for player in server.players
+            if player.username not in before
+        )
+        diff.left.extend(
+            (player, previous) for player in previous.players
+            if player.username not in after
+        )
+
+    for server in old:
+        if server.id not in new:
+            diff.deleted.append(server)
+            diff.left.extend((player, server) for player in server.players)
+
+    return diff
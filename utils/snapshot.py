@@ -0,0 +1,174 @@
+from __future__ import annotations
+
+import itertools
+import sys
+import xml.etree.ElementTree as et
+from typing import Iterable, Iterator, NamedTuple, Optional
+
+
+class Player(NamedTuple):
+    """A player on a server, as listed by ``/api/v2/server/get-all``."""
+
+    user_id: int
+    username: str
+    country_code: Optional[str]
+
+
+class Server(NamedTuple):
+    """A server and its players, as listed by ``/api/v2/server/get-all``."""
+
+    id: int
+    name: str
+    country_code: Optional[str]
+    ip: int
+    port: int
+    max_players: int
+    current_players: int
+    game_mode: int
+    difficulty: int
+    current_track: str
+    password: bool
+    players: tuple[Player, ...]
+
+
+_versions = itertools.count(1)
+
+
+class Snapshot:
+    """
+    Immutable view of the public server list at one point in time.
+
+    Only the records are kept, never the XML tree they were built from.
+    Every snapshot gets a new, increasing ``version``, so anything derived
+    from one can be cached until the next replaces it.
+    """
+
+    __slots__ = ("servers", "version", "_by_id")
+
+    def __init__(self, servers: tuple[Server, ...] = ()):
+        self.servers: tuple[Server, ...] = servers
+        self.version: int = next(_versions)
+        self._by_id: dict[int, Server] = {server.id: server for server in servers}
+
+    def __reduce__(self):
+        # Only the records travel; a snapshot arriving from another
+        # process gets a version of this one.
+        return Snapshot, (self.servers,)
+
+    def __iter__(self) -> Iterator[Server]:
+        return iter(self.servers)
+
+    def __len__(self) -> int:
+        return len(self.servers)
+
+    def __contains__(self, _id: int) -> bool:
+        return _id in self._by_id
+
+    def get(self, _id: int) -> Optional[Server]:
+        return self._by_id.get(_id)
+
+    def ids(self):
+        return self._by_id.keys()
+
+    def players(self) -> Iterator[tuple[Player, Server]]:
+        """Iterates over every (player, server) pair in the snapshot."""
+        for server in self.servers:
+            for player in server.players:
+                yield player, server
+
+
+def make_player(attrib: dict) -> Player:
+    return Player(
+        int(attrib["user-id"]),
+        sys.intern(attrib["username"]),
+        attrib.get("country-code") or None
+    )
+
+
+def make_server(attrib: dict, players: tuple[Player, ...]) -> Server:
+    return Server(
+        int(attrib["id"]),
+        sys.intern(attrib["name"]),
+        attrib.get("country_code") or None,
+        int(attrib.get("ip", 0)),
+        int(attrib.get("port", 0)),
+        int(attrib.get("max_players", 0)),
+        int(attrib.get("current_players", len(players))),
+        int(attrib.get("game_mode", 0)),
+        int(attrib.get("difficulty", 0)),
+        attrib.get("current_track", ""),
+        attrib.get("password", "0") == "1",
+        players
+    )
+
+
+class SnapshotParser:
+    """
+    Incremental parser for get-all responses.
+
+    Feed it the response body in chunks; server and player records are
+    built as soon as their elements are complete, and the elements are
+    thrown away right after, so the full tree never exists in memory.
+    """
+
+    def __init__(self):
+        self._parser = et.XMLPullParser(events=("start", "end"))
+        self._servers: list[Server] = []
+        self._players: list[Player] = []
+        self._serverInfo: Optional[dict] = None
+        self._depth = 0
+        self._container: Optional[et.Element] = None
+        self.attrib: dict = {}
+
+    def feed(self, data: bytes):
+        self._parser.feed(data)
+        self._process()
+
+    def close(self) -> Snapshot:
+        self._parser.close()
+        self._process()
+        return Snapshot(tuple(self._servers))
+
+    def _process(self):
+        for event, elem in self._parser.read_events():
+            if event == "start":
+                self._depth += 1
+
+                if self._depth == 1:
+                    self.attrib = dict(elem.attrib)
+                elif self._depth == 2:
+                    self._container = elem
+                elif elem.tag == "server-info":
+                    self._serverInfo = elem.attrib
+                elif elem.tag == "player-info":
+                    self._players.append(make_player(elem.attrib))
+                continue
+
+            self._depth -= 1
+
+            if elem.tag == "server" and self._serverInfo is not None:
+                self._servers.append(make_server(self._serverInfo, tuple(self._players)))
+                self._serverInfo = None
+                self._players = []
+                # Drop the finished server element from the tree.
+                self._container.clear()
+
+
+def parse_snapshot(data: bytes) -> Snapshot:
+    """Parses a complete get-all response body into a snapshot."""
+    parser = SnapshotParser()
+    parser.feed(data)
+    return parser.close()
+
+
+def parse_chunks(chunks: Iterable[bytes]) -> tuple[Snapshot, dict]:
+    """
+    Parses a get-all response body given in chunks.
+
+    Returns the snapshot and the attributes of the root element, which
+    tell whether the request succeeded.
+    """
+    parser = SnapshotParser()
+    for chunk in chunks:
+        parser.feed(chunk)
+    return parser.close(), parser.attrib
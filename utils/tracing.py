@@ -0,0 +1,102 @@
+"""
+Per-tick tracing and profiling.
+
+A :class:`Trace` collects the duration of named spans. The trace of the
+running tick is kept in a context variable, so code deep in the call
+stack can add spans without having it passed around; outside of a trace,
+spans cost next to nothing.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import cProfile
+import contextvars
+import io
+import pstats
+import time
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+_current: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar("lina_trace", default=None)
+
+
+class Trace:
+    """Spans recorded during one unit of work, in the order they ended."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.spans: list[tuple[str, float]] = []
+        self.start = time.perf_counter()
+        self.duration = 0.0
+
+    def record(self, name: str, seconds: float):
+        self.spans.append((name, seconds))
+
+    def breakdown(self) -> str:
+        return ", ".join(f"{name} {seconds * 1000:.1f}ms" for name, seconds in self.spans)
+
+
+@contextmanager
+def trace(name: str) -> Iterator[Trace]:
+    """Starts a trace that spans opened inside of it are recorded into."""
+    current = Trace(name)
+    token = _current.set(current)
+    try:
+        yield current
+    finally:
+        current.duration = time.perf_counter() - current.start
+        _current.reset(token)
+
+
+def record(name: str, seconds: float):
+    """Adds an already measured span to the current trace, if any."""
+    current = _current.get()
+    if current is not None:
+        current.record(name, seconds)
+
+
+@contextmanager
+def span(name: str):
+    """Measures the enclosed block as a span of the current trace, if any."""
+    current = _current.get()
+    if current is None:
+        yield
+        return
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        current.record(name, time.perf_counter() - start)
+
+
+class TickProfiler:
+    """Runs cProfile over the next ``ticks`` ticks it is entered for."""
+
+    def __init__(self, ticks: int, limit: int = 40):
+        self.remaining = ticks
+        self.limit = limit
+        self.profile = cProfile.Profile()
+        self.done: asyncio.Future[str] = asyncio.get_running_loop().create_future()
+
+    def __enter__(self):
+        self.profile.enable()
+        return self
+
+    def __exit__(self, *exc):
+        self.profile.disable()
+        self.remaining -= 1
+        if self.remaining <= 0 and not self.done.done():
+            self.done.set_result(self.report())
+
+    @property
+    def finished(self) -> bool:
+        return self.done.done()
+
+    def report(self) -> str:
+        out = io.StringIO()
+        stats = pstats.Stats(self.profile, stream=out)
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(self.limit)
+        stats.sort_stats(pstats.SortKey.TIME).print_stats(self.limit)
+        return out.getvalue()
@@ -0,0 +1,74 @@
+from __future__ import annotations
+
+from typing import Iterable
+
+from utils.addons import Addon
+
+# Tracks shipped with the game, by ID.
+BUILTIN_TRACKS = {
+    "abyss": "Abyss",
+    "alien_signal": "Alien Signal",
+    "ancient_colosseum_labrynth": "Ancient Colosseum Labrynth",
+    "arena_candela_city": "Candela City",
+    "battleisland": "Battle Island",
+    "black_forest": "Black Forest",
+    "candela_city": "Candela City",
+    "cave": "Cave X",
+    "cocoa_temple": "Cocoa Temple",
+    "cornfield_crossing": "Cornfield Crossing",
+    "endcutscene": "What the fuck?",
+    "featunlock": "lina is the best!!",
+    "fortmagma": "Fort Magma",
+    "gplose": "You lost? Too bad.",
+    "gpwin": "Huh?",
+    "gran_paradiso_island": "Gran Paradiso Island",
+    "hacienda": "Hacienda",
+    "hole_drop": "Hole Drop",
+    "icy_soccer_field": "Icy Soccer Field",
+    "introcutscene": "Intro Cutscene",
+    "introcutscene2": "Intro Cutscene (Part 2)",
+    "lasdunasarena": "Las Dunas Arena",
+    "lighthouse": "Around the Lighthouse",
+    "mines": "Old Mine",
+    "minigolf": "Minigolf",
+    "oasis": "Oasis",
+    "olivermath": "Oliver's Math Class",
+    "overworld": "Overworld",
+    "pumpkin_park": "Pumpkin Park",
+    "ravenbridge_mansion": "Ravenbridge Mansion",
+    "sandtrack": "Shifting Sands",
+    "scotland": "Nessie's Pond",
+    "snowmountain": "Northern Resort",
+    "snowtuxpeak": "Snow Peak",
+    "soccer_field": "Soccer Field",
+    "stadium": "The Stadium",
+    "stk_enterprise": "STK Enterprise",
+    "temple": "Temple",
+    "tutorial": "Tutorial",
+    "volcano_island": "Volcan Island",
+    "xr591": "XR591",
+    "zengarden": "Zen Garden",
+}
+
+
+def build_track_names(addons: Iterable[Addon]) -> dict[str, str]:
+    """
+    Builds the track ID -> name table from the built-in tracks and the
+    addon catalogue. Built-in names win over addons with the same ID.
+    """
+    names = {addon.id: addon.name for addon in addons}
+    names.update(BUILTIN_TRACKS)
+    return names
+
+
+def resolve_track(names: dict[str, str], _id: str) -> str:
+    """Looks up the name of a track, as reported by a server."""
+    _id = _id.removeprefix("addon_")
+
+    try:
+        return names[_id]
+    except KeyError:
+        if _id == "":
+            return "None"
+        else:
+            return f"Unknown track (ID: `{_id}`)"
@@ -0,0 +1,251 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import logging
+import random
+import time
+from typing import Mapping, NamedTuple, Optional
+from urllib.parse import parse_qsl
+
+import aiohttp
+
+from utils import metrics, tracing
+from utils.cache import Fingerprint
+from utils.scheduler import Priority, RequestScheduler
+
+log = logging.getLogger("lina.utils.transport")
+
+# Request parameters that must never end up in the logs.
+SECRET_PARAMS = frozenset({"token", "password"})
+
+# POST endpoints that only read, so sending them twice is harmless.
+IDEMPOTENT_POSTS = frozenset({
+    "/api/v2/user/poll",
+    "/api/v2/user/top-players",
+    "/api/v2/user/get-ranking",
+    "/api/v2/user/get-friends-list",
+    "/api/v2/user/user-search",
+})
+
+# Statuses worth trying again after a while.
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+
+class EndpointPolicy(NamedTuple):
+    """How long to wait for an endpoint, and how often to try it."""
+
+    timeout: aiohttp.ClientTimeout
+    retries: int = 2
+
+
+DEFAULT_POLICY = EndpointPolicy(aiohttp.ClientTimeout(total=30, connect=5, sock_read=10))
+
+ENDPOINT_POLICIES: dict[str, EndpointPolicy] = {
+    # Polled every 5 seconds: rather give up quickly and try on the next tick
+    # than let a stalled upstream hold up the poll loop.
+    "/api/v2/server/get-all": EndpointPolicy(
+        aiohttp.ClientTimeout(total=8, connect=3, sock_read=4), retries=1),
+    "/downloads/xml/online_assets.xml": EndpointPolicy(
+        aiohttp.ClientTimeout(total=120, connect=5, sock_read=30)),
+}
+
+
+class STKResponse(NamedTuple):
+    status: int
+    headers: Mapping[str, str]
+    chunks: list[bytes]
+
+    @property
+    def body(self) -> bytes:
+        return b"".join(self.chunks)
+
+
+class _Params:
+    """Request parameters, rendered with secrets masked only when logged."""
+
+    __slots__ = ("data",)
+
+    def __init__(self, data: Optional[str]):
+        self.data = data
+
+    def __str__(self) -> str:
+        if not self.data:
+            return "-"
+        return " ".join(
+            f"{k}={'[REDACTED]' if k in SECRET_PARAMS else v}"
+            for k, v in parse_qsl(self.data, keep_blank_values=True)
+        )
+
+
+def backoff(attempt: int, base: float = 0.5, cap: float = 8.0) -> float:
+    """Full-jitter exponential backoff for the given retry (starting at 0)."""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class STKTransport:
+    """
+    HTTP client for the STK API.
+
+    Keeps a pool of keep-alive connections with cached DNS lookups, asks
+    for compressed responses, applies per-endpoint timeouts and retries
+    idempotent requests with jittered exponential backoff. Each attempt
+    waits for a slot of the ``scheduler``, so backing off never holds up
+    anyone else.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        scheduler: RequestScheduler,
+        *,
+        user_agent: str = "DiscordBot (linaSTK 1.0)",
+        policies: Optional[dict[str, EndpointPolicy]] = None
+    ):
+        self.base_url = base_url
+        self.scheduler = scheduler
+        self.policies = {**ENDPOINT_POLICIES, **(policies or {})}
+        self.retries = 0
+        self.session = aiohttp.ClientSession(
+            base_url,
+            connector=aiohttp.TCPConnector(
+                limit=scheduler.concurrency * 2,
+                ttl_dns_cache=300,
+                keepalive_timeout=60
+            ),
+            headers={
+                "User-Agent": user_agent,
+                "Accept-Encoding": "gzip, deflate"
+            },
+            timeout=DEFAULT_POLICY.timeout
+        )
+
+    @property
+    def closed(self) -> bool:
+        return self.session.closed
+
+    async def close(self):
+        await self.session.close()
+
+    async def post(
+        self, target: str, data: str, *, priority: Priority = Priority.INTERACTIVE
+    ) -> bytes:
+        r = await self.request(
+            "POST", target, data=data,
+            headers={"Content-Type": "application/x-www-form-urlencoded"},
+            priority=priority, idempotent=target in IDEMPOTENT_POSTS
+        )
+        return r.body
+
+    async def get(self, target: str, *, priority: Priority = Priority.INTERACTIVE) -> bytes:
+        r = await self.request("GET", target, priority=priority)
+        return r.body
+
+    async def get_conditional(
+        self, target: str, last: Optional[Fingerprint] = None, *,
+        priority: Priority = Priority.INTERACTIVE
+    ) -> tuple[Optional[list[bytes]], Optional[Fingerprint]]:
+        """
+        Sends a conditional GET request.
+
+        Returns the body as a list of chunks and its fingerprint. If the
+        resource did not change since ``last`` (either the server answered
+        304 or the body hashes the same), the chunks are None.
+        """
+        headers = {}
+        if last is not None:
+            if last.etag:
+                headers["If-None-Match"] = last.etag
+            if last.last_modified:
+                headers["If-Modified-Since"] = last.last_modified
+
+        r = await self.request("GET", target, headers=headers, priority=priority)
+        if r.status == 304:
+            return None, last
+
+        digest = hashlib.blake2b(digest_size=16)
+        for chunk in r.chunks:
+            digest.update(chunk)
+
+        fingerprint = Fingerprint(
+            digest.digest(),
+            r.headers.get("ETag"),
+            r.headers.get("Last-Modified")
+        )
+
+        if last is not None and fingerprint.digest == last.digest:
+            return None, fingerprint
+
+        return r.chunks, fingerprint
+
+    async def request(
+        self,
+        method: str,
+        target: str,
+        *,
+        data: Optional[str] = None,
+        headers: Optional[dict[str, str]] = None,
+        priority: Priority = Priority.INTERACTIVE,
+        idempotent: Optional[bool] = None
+    ) -> STKResponse:
+        """
+        Sends a request and reads the whole (decompressed) body.
+
+        Error statuses raise :class:`aiohttp.ClientResponseError`, except
+        304 which is returned as is.
+        """
+        policy = self.policies.get(target, DEFAULT_POLICY)
+        if idempotent is None:
+            idempotent = method == "GET"
+        attempts = policy.retries + 1 if idempotent else 1
+
+        attempt = 0
+        while True:
+            try:
+                return await self._send(method, target, data, headers, priority, policy, attempt)
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                error = e
+            except aiohttp.ClientResponseError as e:
+                if e.status not in RETRY_STATUSES:
+                    raise
+                error = e
+
+            if attempt + 1 >= attempts:
+                raise error
+
+            delay = backoff(attempt)
+            attempt += 1
+            self.retries += 1
+            metrics.stk_request_retries.labels(endpoint=target).inc()
+            log.warning("STK %s %s failed (%s: %s), retrying in %.2fs",
+                        method, target, error.__class__.__name__, error, delay)
+            await asyncio.sleep(delay)
+
+    async def _send(
+        self, method, target, data, headers, priority, policy, attempt
+    ) -> STKResponse:
+        async with self.scheduler.slot(priority):
+            with metrics.stk_request_seconds.labels(endpoint=target).time():
+                start = time.perf_counter()
+                async with self.session.request(
+                    method, target, data=data, headers=headers, timeout=policy.timeout
+                ) as r:
+                    tracing.record("fetch", time.perf_counter() - start)
+                    if r.status != 304:
+                        r.raise_for_status()
+
+                    chunks = []
+                    with tracing.span("read"):
+                        async for chunk in r.content.iter_chunked(16384):
+                            chunks.append(chunk)
+
+        level = logging.INFO if method == "POST" else logging.DEBUG
+        if log.isEnabledFor(level):
+            log.log(
+                level,
+                "STK %s %s status=%d bytes=%d encoding=%s elapsed=%.3fs attempt=%d params=%s",
+                method, target, r.status, sum(map(len, chunks)),
+                r.headers.get("Content-Encoding", "identity"),
+                time.perf_counter() - start, attempt + 1, _Params(data)
+            )
+        return STKResponse(r.status, r.headers, chunks)
@@ -0,0 +1,92 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Hashable, Optional
+
+from utils import metrics
+
+log = logging.getLogger("lina.utils.writebehind")
+
+
+class WriteBehindBuffer:
+    """
+    Collects rows in memory and writes them out in bulk.
+
+    Rows are keyed, and a newer row replaces a pending one with the same
+    key, so only the last value per key is written. The buffer is flushed
+    in the background once it holds ``max_size`` rows or ``interval``
+    seconds after the last flush, whichever comes first.
+    """
+
+    def __init__(
+        self,
+        write: Callable[[list[Any]], Awaitable[Any]],
+        *,
+        max_size: int = 500,
+        interval: float = 30.0,
+        name: str = "buffer"
+    ):
+        self.write = write
+        self.max_size = max_size
+        self.interval = interval
+        self.name = name
+        self.flushes = 0
+        self.rows_written = 0
+        self._pending: dict[Hashable, Any] = {}
+        self._full = asyncio.Event()
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def add(self, key: Hashable, row: Any):
+        self._pending[key] = row
+        if len(self._pending) >= self.max_size:
+            self._full.set()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name=f"lina-{self.name}")
+
+    async def stop(self):
+        """Stops the background flusher and writes out what is left."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+        await self.flush()
+
+    async def flush(self):
+        async with self._lock:
+            self._full.clear()
+            if not self._pending:
+                return
+
+            rows, self._pending = self._pending, {}
+
+            try:
+                with metrics.db_flush_seconds.labels(buffer=self.name).time():
+                    await self.write(list(rows.values()))
+            except Exception:
+                log.exception("%s: Could not write %d rows, keeping them for the next flush.",
+                              self.name, len(rows))
+                # Rows added in the meantime are newer, keep those.
+                for key, row in rows.items():
+                    self._pending.setdefault(key, row)
+            else:
+                self.flushes += 1
+                self.rows_written += len(rows)
+                metrics.db_flush_rows.labels(buffer=self.name).inc(len(rows))
+                log.debug("%s: Wrote %d rows.", self.name, len(rows))
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._full.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+
+            await self.flush()